@@ -1,149 +1,473 @@
-import pyaudio
 import wave
 import threading
 import os
 from datetime import datetime
 import time  # Added for simulation mode
+from wav_writer import StreamingWavWriter, SegmentedWavWriter, BackgroundWavWriter
+from ring_buffer import RingBuffer
+from capture import CapturePipeline
+from clock import SystemClock
+from metrics import default_registry
+
+_RECORDED_BYTES = default_registry.counter("stealthrec_recorded_bytes_total", "Audio bytes written to recordings")
+_RECORDINGS = default_registry.counter("stealthrec_recordings_total", "Recordings saved")
+_START_LATENCY = default_registry.histogram(
+    "stealthrec_stage_seconds", "Time spent in each stage of the pipeline", stage="start_recording")
+_FINISH_LATENCY = default_registry.histogram(
+    "stealthrec_stage_seconds", "Time spent in each stage of the pipeline", stage="finish_recording")
 
 class AudioRecorder:
-    def __init__(self):
-        self.is_simulation_mode = False
-        try:
-            self.audio = pyaudio.PyAudio()
-            # Get default input device info
-            device_count = self.audio.get_host_api_info_by_index(0).get('deviceCount')
-            if device_count == 0:
-                print("\nNo audio input devices found. Entering simulation mode.")
-                self._setup_simulation_mode()
-            else:
-                # Try to use the default input device
-                try:
-                    default_input = self.audio.get_default_input_device_info()
-                    print(f"\nUsing audio input device: {default_input.get('name')}")
-                except Exception:
-                    print("\nCould not access audio device. Entering simulation mode.")
-                    self._setup_simulation_mode()
-        except Exception as e:
-            print(f"\nWarning: Error initializing audio system: {str(e)}")
-            print("Entering simulation mode.")
-            self._setup_simulation_mode()
+    def __init__(self, streaming=True, pre_roll_seconds=5.0, capture=None, segment_seconds=None,
+                 segment_bytes=None, on_segment=None, output_rate=None, encoder=None, directory="recordings",
+                 catalog=None, clock=None, simulated_audio=None, name="recording", integrity=False,
+                 integrity_key=None, uploader=None):
+        # Share the capture pipeline (and so the input device) with the
+        # voice detector when one is given, otherwise own a private one
+        self._owns_capture = capture is None
+        self.capture = capture if capture is not None else CapturePipeline()
+        self.audio = self.capture.audio
+        self.is_simulation_mode = self.capture.is_simulation_mode
+        if self.is_simulation_mode:
+            print("Recording simulation mode active - no actual audio will be captured.")
+        # Streaming mode appends chunks to the WAV file while recording
+        # instead of holding every frame in memory until stop
+        self.streaming = streaming
+        # Seconds of audio from before start_recording() to include
+        # in each recording (only captured while armed)
+        self.pre_roll_seconds = pre_roll_seconds
+        # Segmented mode (streaming only) splits each recording into a
+        # directory of bounded WAV segments plus a manifest.json;
+        # on_segment(path, info) is called as each segment is finished
+        self.segment_seconds = segment_seconds
+        self.segment_bytes = segment_bytes
+        self.on_segment = on_segment
+        # Optionally resample to a lower rate while recording (16000 is
+        # plenty for speech) and hand finished files to a RecordingEncoder
+        self.output_rate = output_rate
+        self.encoder = encoder
+        # Finished files and segments are also handed to a RecordingUploader
+        # to be copied off the device
+        self.uploader = uploader
+        self._resampler = None
+        self.directory = directory
+        self.name = name
+        # Saved recordings are indexed here along with a checksum and a
+        # waveform envelope computed while they are written
+        self.catalog = catalog
+        self._summary = None
+        # Integrity mode hashes the audio into a chain of block hashes as
+        # it is written and saves it (HMAC-signed with integrity_key, if
+        # given) as a manifest next to each recording
+        self.integrity = integrity
+        self.integrity_key = integrity_key
+        self._chain = None
+        self._trigger = None
+        self._triggered_at = None
+        # Simulation mode produces simulated_audio(frames) (silence by
+        # default) as the clock advances; a VirtualClock runs it faster
+        # than real time
+        self.clock = clock if clock is not None else SystemClock()
+        self.simulated_audio = simulated_audio or self._silence
+        self._simulated_frames = 0
+
+        # Called with the error message when capture fails mid-recording,
+        # so a controller can stop and save the recording itself; without
+        # it the recorder stops on its own
+        self.on_capture_error = None
 
-        self.stream = None
+        self._subscription = None
         self.frames = []
         self.is_recording = False
-        self.sample_rate = 44100
-        self.chunk_size = 1024
-        self.channels = 1
-        self.format = pyaudio.paInt16
+        self.sample_rate = self.capture.sample_rate
+        self.chunk_size = self.capture.chunk_size
+        self.channels = self.capture.channels
+        self.format = self.capture.format
+        self._frame_bytes = self.channels * self.audio.get_sample_size(self.format)
         self._recording_thread = None
+        self._writer = None
+        self._lock = threading.Lock()
+        # Serializes start/stop/arm, which may come from the command loop
+        # and a UI at the same time (reentrant for the error path in _record)
+        self._control_lock = threading.RLock()
+        self.is_armed = False
         self.simulation_start_time = None
+        # Capture stream frame at which the current recording starts, for
+        # lining it up with recordings from other devices
+        self.recording_start_frame = None
+        self._frames_read = 0
+
+        pre_roll_bytes = int(pre_roll_seconds * self.sample_rate) * self.channels * self.audio.get_sample_size(self.format)
+        self._pre_roll = RingBuffer(pre_roll_bytes) if pre_roll_bytes > 0 else None
 
-    def _setup_simulation_mode(self):
-        """Set up simulation mode for testing"""
-        self.is_simulation_mode = True
-        self.audio = pyaudio.PyAudio()
-        self.sample_rate = 44100
-        self.channels = 1
-        self.format = pyaudio.paInt16
-        print("Recording simulation mode active - no actual audio will be captured.")
-
-    def start_recording(self):
-        """Start audio recording or simulation"""
+    def start_recording(self, trigger=None):
+        """Start audio recording or simulation; trigger notes what started
+        it (e.g. "voice") in the catalog"""
+        with self._control_lock:
+            return self._start_recording(trigger)
+
+    def _start_recording(self, trigger):
         if self.is_recording:
             print("\nAlready recording...")
             return False
 
-        self.is_recording = True
-        self.frames = []
+        self._trigger = trigger
+        self._triggered_at = self.clock.time()
+        self._summary = None
+        self._chain = None
+        self.recording_start_frame = None
 
         if self.is_simulation_mode:
-            self.simulation_start_time = time.time()
+            with self._lock:
+                self._begin_capture()
+                self.is_recording = True
+                self.simulation_start_time = self.clock.monotonic()
+                self._simulated_frames = 0
+            self._recording_thread = threading.Thread(target=self._record, daemon=True)
+            self._recording_thread.start()
             print("\nSimulated recording started...")
             return True
 
         try:
-            # Configure and open audio stream
-            self.stream = self.audio.open(
-                format=self.format,
-                channels=self.channels,
-                rate=self.sample_rate,
-                input=True,
-                frames_per_buffer=self.chunk_size
-            )
+            started = time.perf_counter()
+            if self.is_armed:
+                # Audio is already flowing; switch the recording thread from
+                # the pre-roll buffer to the recording
+                with self._lock:
+                    self._begin_capture()
+                    self.is_recording = True
+                _START_LATENCY.observe(time.perf_counter() - started)
+                print(f"\nRecording started (including {self.pre_roll_seconds:.1f}s pre-roll)...")
+                return True
+
+            self.is_recording = True
+            self._begin_capture()
+            self._subscribe()
 
             # Start recording thread
             self._recording_thread = threading.Thread(target=self._record)
             self._recording_thread.start()
+            _START_LATENCY.observe(time.perf_counter() - started)
             print("\nRecording started...")
             return True
         except Exception as e:
             print(f"\nError starting recording: {str(e)}")
             self.is_recording = False
+            self._discard_writer()
             return False
 
+    def arm(self):
+        """Start consuming audio ahead of time and keep the last
+        pre_roll_seconds of it ready for the next recording"""
+        with self._control_lock:
+            if self.is_armed or self.is_recording or self.is_simulation_mode or self._pre_roll is None:
+                return False
+
+            try:
+                self._subscribe()
+                self.is_armed = True
+                self._recording_thread = threading.Thread(target=self._record, daemon=True)
+                self._recording_thread.start()
+                print(f"\nRecorder armed with {self.pre_roll_seconds:.1f}s pre-roll.")
+                return True
+            except Exception as e:
+                print(f"\nError arming recorder: {str(e)}")
+                self.is_armed = False
+                return False
+
+    def disarm(self):
+        """Stop buffering pre-roll audio and leave the capture pipeline"""
+        with self._control_lock:
+            if not self.is_armed:
+                return
+            self.is_armed = False
+            if not self.is_recording:
+                self._unsubscribe()
+
+    def _subscribe(self):
+        """Subscribe to the capture pipeline, starting it if needed"""
+        # Room for a few seconds of audio in case writing falls behind
+        maxsize = int(5 * self.sample_rate / self.chunk_size)
+        self._subscription = self.capture.subscribe("recorder", maxsize=maxsize)
+        self._frames_read = 0
+        try:
+            self.capture.start()
+        except Exception:
+            self._unsubscribe()
+            raise
+
+    def _unsubscribe(self):
+        """Wait for the recording thread to finish and leave the pipeline"""
+        subscription, self._subscription = self._subscription, None
+        if subscription:
+            self.capture.unsubscribe(subscription)
+            if subscription.dropped:
+                print(f"\nWarning: {subscription.dropped} audio chunks were dropped while recording.")
+
+        if (self._recording_thread and self._recording_thread.is_alive()
+                and self._recording_thread is not threading.current_thread()):
+            self._recording_thread.join(timeout=2.0)
+
+        # A private pipeline is only needed while this recorder uses it
+        if self._owns_capture:
+            self.capture.stop()
+
+    @property
+    def recording_rate(self):
+        """Sample rate of the saved recordings"""
+        return self.output_rate or self.sample_rate
+
+    def _begin_capture(self):
+        """Prepare the writer or frame buffer, seeded with the pre-roll audio"""
+        self.frames = []
+        self._resampler = None
+        if self.recording_rate != self.sample_rate:
+            from resampler import PolyphaseResampler
+            self._resampler = PolyphaseResampler(self.sample_rate, self.recording_rate, self.channels)
+        if self.catalog is not None:
+            from catalog import RecordingSummary
+            self._summary = RecordingSummary(self.recording_rate, self.channels)
+        if self.integrity:
+            from integrity import HashChain
+            self._chain = HashChain()
+        pre_roll = self._pre_roll.views() if self.is_armed else []
+        if pre_roll and self._subscription and self._subscription.start_frame is not None:
+            # The recording begins with the buffered pre-roll
+            self.recording_start_frame = (self._subscription.start_frame + self._frames_read
+                                          - len(self._pre_roll) // self._frame_bytes)
+        if self.streaming:
+            self._writer = self._open_writer(self._new_filename(), pre_roll)
+        else:
+            self.frames = [self._convert(view) for view in pre_roll]
+            for frame in self.frames:
+                self._account(frame)
+
+    def _convert(self, data):
+        """Resample a chunk to the recording rate if needed"""
+        if self._resampler is not None:
+            return self._resampler.process(data)
+        return bytes(data)
+
+    def _new_filename(self):
+        """Generate filename with timestamp in recordings directory"""
+        timestamp = datetime.fromtimestamp(self.clock.time()).strftime("%Y%m%d_%H%M%S")
+        return os.path.join(self.directory, f"{self.name}_{timestamp}.wav")
+
+    def _open_writer(self, filename, pre_roll=()):
+        """Open a background WAV writer for a new recording"""
+        if self.segment_seconds or self.segment_bytes:
+            writer = SegmentedWavWriter(
+                os.path.splitext(filename)[0],
+                channels=self.channels,
+                sample_width=self.audio.get_sample_size(self.format),
+                sample_rate=self.recording_rate,
+                segment_seconds=self.segment_seconds,
+                segment_bytes=self.segment_bytes,
+                on_segment=self._segment_finished
+            )
+        else:
+            writer = StreamingWavWriter(
+                filename,
+                channels=self.channels,
+                sample_width=self.audio.get_sample_size(self.format),
+                sample_rate=self.recording_rate
+            )
+        # Pre-roll views alias the ring buffer, so write them straight to
+        # the file before the capture thread can overwrite them
+        for view in pre_roll:
+            data = view if self._resampler is None else self._resampler.process(view)
+            writer.write(data)
+            self._account(data)
+        return BackgroundWavWriter(writer)
+
+    def _segment_finished(self, path, info):
+        """Pass a finished segment on to the encoder and the caller"""
+        if self.encoder is not None:
+            self.encoder.submit(path)
+        if self.uploader is not None:
+            self.uploader.submit(path)
+        if self.on_segment:
+            self.on_segment(path, info)
+
+    def _recording_finished(self, filename):
+        """Report resampling cost and queue a finished file for encoding"""
+        _RECORDINGS.inc()
+        if self._resampler is not None:
+            print(f"Resampled to {self.recording_rate} Hz using "
+                  f"{self._resampler.cpu_per_audio_second * 1000:.1f} ms CPU per second of audio.")
+        if self._chain is not None:
+            self._save_integrity_manifest(filename)
+        if self.uploader is not None:
+            # Segments went as they finished; this is the file or the manifest
+            self.uploader.submit(filename)
+        if self.catalog is not None:
+            self._catalog_recording(filename)
+        # Segments have already been queued one by one
+        if self.encoder is not None and filename.lower().endswith('.wav'):
+            self.encoder.submit(filename)
+
+    def _catalog_recording(self, filename):
+        """Add a saved recording to the catalog"""
+        try:
+            self.catalog.add(filename, self._summary, stopped_at=self.clock.time(), trigger=self._trigger,
+                             triggered_at=self._triggered_at)
+        except Exception as e:
+            print(f"\nWarning: Could not add {filename} to the catalog: {str(e)}")
+
+    def _save_integrity_manifest(self, filename):
+        """Write the hash chain built while recording next to the recording"""
+        from integrity import write_manifest
+        try:
+            manifest = self._chain.manifest(self.recording_rate, self.channels, self.integrity_key)
+            path = write_manifest(filename, manifest)
+            if self.uploader is not None:
+                self.uploader.submit(path)
+        except Exception as e:
+            print(f"\nWarning: Could not save the integrity manifest of {filename}: {str(e)}")
+
+    def _discard_writer(self):
+        """Close and remove the file of a recording that never started"""
+        if self._writer:
+            self._writer.discard()
+            self._writer = None
+
+    def _store_chunk(self, data):
+        """Hand a captured chunk to the writer or the in-memory buffer"""
+        if self._resampler is not None:
+            data = self._resampler.process(data)
+        self._account(data)
+        if self._writer:
+            self._writer.write(data)
+        else:
+            self.frames.append(data)
+
+    def _account(self, data):
+        """Count recorded audio and add it to the catalog summary and hash chain"""
+        _RECORDED_BYTES.inc(len(data))
+        if self._summary is not None:
+            self._summary.update(data)
+        if self._chain is not None:
+            self._chain.update(data)
+
     def _record(self):
         """Internal method to record audio or simulate recording"""
         if self.is_simulation_mode:
-            while self.is_recording:
-                # Simulate recording by generating silent frames
-                self.frames.append(b'\x00' * self.chunk_size * 2)  # 2 bytes per sample
-                time.sleep(self.chunk_size / self.sample_rate)  # Simulate real-time recording
+            # Produce each chunk once the clock reaches its end; a later
+            # recording gets a thread of its own
+            while self.is_recording and self._recording_thread is threading.current_thread():
+                self.clock.sleep_until(
+                    self.simulation_start_time + (self._simulated_frames + self.chunk_size) / self.sample_rate)
+                self.simulate_until(self.clock.monotonic())
         else:
-            while self.is_recording and self.stream:
+            subscription = self._subscription
+            while (self.is_recording or self.is_armed) and subscription:
                 try:
-                    data = self.stream.read(self.chunk_size, exception_on_overflow=False)
-                    self.frames.append(data)
+                    data = subscription.read()
+                    if not data:
+                        # Unsubscribed, or the capture pipeline has stopped
+                        if subscription.closed and (self.is_recording or self.is_armed):
+                            raise OSError("audio capture ended")
+                        break
+                    with self._lock:
+                        if self.is_recording:
+                            if self.recording_start_frame is None and subscription.start_frame is not None:
+                                self.recording_start_frame = subscription.start_frame + self._frames_read
+                            self._store_chunk(data)
+                        elif self._pre_roll is not None:
+                            self._pre_roll.write(data)
+                        self._frames_read += len(data) // self._frame_bytes
                 except Exception as e:
                     print(f"\nError during recording: {str(e)}")
-                    self.stop_recording()
+                    self.is_armed = False
+                    if self.is_recording:
+                        if self.on_capture_error is not None:
+                            self.on_capture_error(str(e))
+                        else:
+                            self.stop_recording()
                     break
 
+    def simulate_until(self, now):
+        """Feed the simulated recording every whole chunk up to clock time
+        now; returns the number of chunks added"""
+        with self._lock:
+            if not (self.is_simulation_mode and self.is_recording):
+                return 0
+            target = int((now - self.simulation_start_time) * self.sample_rate)
+            chunks = 0
+            while target - self._simulated_frames >= self.chunk_size:
+                self._store_chunk(self.simulated_audio(self.chunk_size))
+                self._simulated_frames += self.chunk_size
+                chunks += 1
+            return chunks
+
+    def _silence(self, frames):
+        return bytes(frames * self.channels * self.audio.get_sample_size(self.format))
+
     def stop_recording(self):
         """Stop the audio recording/simulation and save to file"""
+        with self._control_lock:
+            return self._stop_recording()
+
+    def _stop_recording(self):
         if not self.is_recording:
             print("\nNo active recording to stop.")
             return None
 
         try:
-            self.is_recording = False
+            if self.is_simulation_mode:
+                # Include the audio simulated time has produced so far
+                self.simulate_until(self.clock.monotonic())
+            with self._lock:
+                self.is_recording = False
+                # Start the next pre-roll from scratch
+                if self._pre_roll is not None:
+                    self._pre_roll.clear()
 
             if self.is_simulation_mode and self.simulation_start_time is not None:
                 # Calculate simulated recording duration
-                duration = time.time() - self.simulation_start_time
+                duration = self.clock.monotonic() - self.simulation_start_time
                 print(f"\nSimulated recording stopped after {duration:.1f} seconds")
-            else:
-                # Wait for recording thread to finish
-                if self._recording_thread and self._recording_thread.is_alive():
-                    self._recording_thread.join(timeout=2.0)
+            elif not self.is_armed:
+                self._unsubscribe()
 
-                if self.stream:
-                    self.stream.stop_stream()
-                    self.stream.close()
-                    self.stream = None
+            if self._writer:
+                return self._finish_streaming()
 
             if not self.frames:
                 print("\nNo audio data recorded.")
                 return None
 
-            # Generate filename with timestamp in recordings directory
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = os.path.join("recordings", f"recording_{timestamp}.wav")
+            filename = self._new_filename()
 
             # Save the recording
-            self._save_recording(filename)
+            with _FINISH_LATENCY.time():
+                self._save_recording(filename)
             print(f"\nRecording saved as: {filename}")
+            self._recording_finished(filename)
             return filename
         except Exception as e:
             print(f"\nError stopping recording: {str(e)}")
             return None
 
+    def _finish_streaming(self):
+        """Finalize the file written during a streaming recording"""
+        writer, self._writer = self._writer, None
+        with _FINISH_LATENCY.time():
+            bytes_written = writer.close()
+        if bytes_written == 0:
+            print("\nNo audio data recorded.")
+            writer.discard()
+            return None
+        print(f"\nRecording saved as: {writer.filename}")
+        self._recording_finished(writer.filename)
+        return writer.filename
+
     def _save_recording(self, filename):
         """Save the recorded audio to a WAV file"""
         try:
             with wave.open(filename, 'wb') as wf:
                 wf.setnchannels(self.channels)
                 wf.setsampwidth(self.audio.get_sample_size(self.format))
-                wf.setframerate(self.sample_rate)
+                wf.setframerate(self.recording_rate)
                 wf.writeframes(b''.join(self.frames))
         except Exception as e:
             print(f"\nError saving recording: {str(e)}")
@@ -152,6 +476,8 @@ class AudioRecorder:
         """Cleanup when object is destroyed"""
         if self.is_recording:
             self.stop_recording()
-        if self.stream:
-            self.stream.close()
-        self.audio.terminate()
\ No newline at end of file
+        self.is_armed = False
+        if self._subscription:
+            self._unsubscribe()
+        if self._owns_capture:
+            self.capture.terminate()
\ No newline at end of file
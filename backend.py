@@ -0,0 +1,148 @@
+import queue
+import threading
+import asyncio
+from main import init_components, stop_uploads
+from orchestrator import Orchestrator
+from utils import create_recordings_directory
+
+# Queued by Backend.shutdown() to end the command thread
+_STOP = object()
+
+
+class Backend:
+    """Run the detector/recorder loop on a worker thread for a UI.
+
+    State changes are published as (event, detail) tuples that the UI
+    drains with poll() from its own thread (e.g. on a Kivy Clock tick),
+    so the UI never waits on audio or the network. Commands from the UI
+    ("stop_recording", "rearm") are queued with send() and carried out on
+    a separate command thread, so a stop takes effect right away instead
+    of after the current listen; commands sent while the backend is still
+    starting are carried out once it is ready.
+
+    Events: "initializing", "ready", "armed", "recording_started",
+    "recording_stopped" (filename), "error" (message) and "stopped", plus
+    the Orchestrator's "state" and alert events.
+    """
+
+    def __init__(self, start_command, stop_command, sen_number):
+        self.start_command = start_command.lower()
+        self.stop_command = stop_command.lower()
+        self.sen_number = sen_number
+        self.capture = None
+        self.detector = None
+        self.recorder = None
+        self.orchestrator = None
+        self._events = queue.Queue()
+        self._commands = queue.Queue()
+        self._stop_event = threading.Event()
+        self._ready = threading.Event()
+        self._replacing = None
+        self._thread = None
+        self._command_thread = None
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, replacing=None):
+        """Initialize the components and start listening in the background.
+
+        replacing is a previous Backend to shut down first; that happens
+        on the backend thread too, so the caller never waits for it.
+        """
+        if self._thread is not None:
+            return
+        self._replacing = replacing
+        self._thread = threading.Thread(target=self._run, name="backend", daemon=True)
+        self._thread.start()
+        self._command_thread = threading.Thread(target=self._handle_commands, name="backend-commands", daemon=True)
+        self._command_thread.start()
+
+    def send(self, command):
+        """Queue a command from the UI: "stop_recording" or "rearm" """
+        self._commands.put(command)
+
+    def poll(self):
+        """Return the events published since the last call (never blocks)"""
+        events = []
+        while True:
+            try:
+                events.append(self._events.get_nowait())
+            except queue.Empty:
+                return events
+
+    def shutdown(self, timeout=5.0):
+        """Stop listening, finish any recording and release the device"""
+        self._stop_event.set()
+        self._commands.put(_STOP)
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+        if self._command_thread is not None:
+            self._command_thread.join(timeout=timeout)
+        if self.recorder is not None:
+            # Even if the backend thread is still saving, queued uploads
+            # must not hold up exiting
+            stop_uploads(self.recorder)
+
+    def _publish(self, event, detail=None):
+        self._events.put((event, detail))
+
+    def _run(self):
+        self._publish("initializing")
+        if self._replacing is not None:
+            # The previous backend must release the device first
+            self._replacing.shutdown()
+            self._replacing = None
+        try:
+            create_recordings_directory()
+            self.capture, self.detector, self.recorder = init_components(
+                self.start_command, self.stop_command, self.sen_number)
+        except Exception as e:
+            print(f"\nError starting backend: {str(e)}")
+            self._publish("error", str(e))
+            self._publish("stopped")
+            # Commands waiting for the backend are answered with an error
+            self._stop_event.set()
+            return
+
+        self.orchestrator = Orchestrator(self.detector, self.recorder, self.start_command, self.stop_command,
+                                         on_event=self._publish)
+        self._ready.set()
+        self._publish("ready")
+        try:
+            asyncio.run(self.orchestrator.run(self._stop_event))
+        finally:
+            self.recorder.disarm()
+            if self.detector.continuous is not None:
+                self.detector.continuous.stop()
+            self.detector.dispatcher.stop()
+            stop_uploads(self.recorder)
+            self.capture.stop()
+            self._publish("stopped")
+
+    def _handle_commands(self):
+        while True:
+            command = self._commands.get()
+            if command is _STOP:
+                break
+            # Hold commands sent during startup until the backend is ready
+            while not self._ready.wait(timeout=0.1):
+                if self._stop_event.is_set():
+                    break
+            if not self._ready.is_set():
+                self._publish("error", "The backend is not running")
+                continue
+            try:
+                if command == "stop_recording":
+                    # Saved in the background; "recording_stopped" follows
+                    self.orchestrator.post("stop", "ui")
+                elif command == "rearm":
+                    self.recorder.arm()
+                    if self.recorder.is_armed:
+                        self._publish("armed")
+                else:
+                    self._publish("error", f"Unknown command: {command}")
+            except Exception as e:
+                print(f"\nError handling {command}: {str(e)}")
+                self._publish("error", str(e))
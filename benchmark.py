@@ -0,0 +1,310 @@
+"""
+Replay benchmark for the detection and recording pipeline.
+
+Feeds fixture WAV files through a stand-in for pyaudio.PyAudio into the
+real CapturePipeline, VoiceDetector, AudioRecorder and main loop, then
+reports trigger latency percentiles, missed and false triggers, lost
+frames and memory use.
+
+Each fixture is a 16-bit mono WAV with a JSON sidecar of the same name
+describing when each command finishes being spoken:
+
+    {"start_command": "help", "stop_command": "stop",
+     "events": [{"time": 3.2, "command": "start"},
+                {"time": 41.0, "command": "stop"}]}
+
+Usage:
+    python benchmark.py fixtures/*.wav --keywords keywords [--speed 1.0] [--json]
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import wave
+
+import pyaudio
+
+from audio_recorder import AudioRecorder
+from capture import CapturePipeline
+from main import run
+from messaging import AlertDispatcher, MemoryTransport
+from voice_detector import VoiceDetector
+
+
+class FixtureStream:
+    """Input stream that plays back PCM at (a multiple of) real time.
+
+    Like a real device it only holds `buffer_chunks` chunks: a reader that
+    falls further behind loses audio, which is counted as overflowed frames.
+    Given a stream_callback it pushes each chunk to it from its own thread,
+    as PyAudio does in callback mode.
+    """
+
+    def __init__(self, pcm, sample_rate, chunk_size, speed=1.0, buffer_chunks=16, stream_callback=None):
+        self.pcm = pcm
+        self.sample_rate = sample_rate
+        self.chunk_size = chunk_size
+        self.speed = speed
+        self.buffer_frames = buffer_chunks * chunk_size
+        self.total_frames = len(pcm) // 2
+        self.position = 0
+        self.overflowed_frames = 0
+        self.active = True
+        self.started_at = time.perf_counter()
+        if stream_callback is not None:
+            threading.Thread(target=self._push, args=(stream_callback,), daemon=True).start()
+
+    def _push(self, callback):
+        while self.active:
+            overflowed = self.overflowed_frames
+            data = self.read(self.chunk_size)
+            flags = pyaudio.paInputOverflow if self.overflowed_frames != overflowed else 0
+            callback(data, self.chunk_size, {}, flags)
+
+    def wall_time(self, fixture_seconds):
+        """Wall clock time at which a point in the fixture is delivered"""
+        return self.started_at + fixture_seconds / self.speed
+
+    @property
+    def finished(self):
+        return self.position >= self.total_frames
+
+    def read(self, num_frames, exception_on_overflow=True):
+        due = self.wall_time((self.position + num_frames) / self.sample_rate)
+        now = time.perf_counter()
+        if now < due:
+            time.sleep(due - now)
+        else:
+            behind = int((now - due) * self.speed * self.sample_rate)
+            if behind > self.buffer_frames:
+                # The device buffer overflowed; the oldest audio is gone
+                skipped = behind - self.buffer_frames
+                self.position += skipped
+                self.overflowed_frames += skipped
+        data = self.pcm[self.position * 2:(self.position + num_frames) * 2]
+        self.position += num_frames
+        # Silence after the end of the fixture
+        return data + b'\x00' * (num_frames * 2 - len(data))
+
+    def is_active(self):
+        return self.active
+
+    def stop_stream(self):
+        self.active = False
+
+    def close(self):
+        self.active = False
+
+
+class FixturePyAudio:
+    """Stand-in for pyaudio.PyAudio whose only input device is a fixture"""
+
+    def __init__(self, path, speed=1.0):
+        with wave.open(path, 'rb') as wf:
+            if wf.getsampwidth() != 2 or wf.getnchannels() != 1:
+                raise ValueError(f"{path} must be 16-bit mono")
+            self.sample_rate = wf.getframerate()
+            self.pcm = wf.readframes(wf.getnframes())
+        self.path = path
+        self.speed = speed
+        self.stream = None
+
+    def get_host_api_info_by_index(self, index):
+        return {'deviceCount': 1}
+
+    def get_default_input_device_info(self):
+        return {'name': f"fixture:{os.path.basename(self.path)}", 'index': 0}
+
+    def get_sample_size(self, format):
+        return 2
+
+    def open(self, rate, frames_per_buffer=1024, stream_callback=None, **kwargs):
+        self.stream = FixtureStream(self.pcm, rate, frames_per_buffer, self.speed, stream_callback=stream_callback)
+        return self.stream
+
+    def terminate(self):
+        pass
+
+
+def rss_kb():
+    """Current resident set size in KiB (Linux), or None"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def match_triggers(expected, actual, tolerance):
+    """Pair each trigger with the earliest unmatched expected event before it.
+
+    Returns (latencies, missed, false_triggers); a trigger more than
+    `tolerance` seconds after any matching event counts as false.
+    """
+    latencies, used = [], set()
+    false_triggers = 0
+    for command, fired_at in actual:
+        match = None
+        for i, (expected_command, due_at) in enumerate(expected):
+            if i not in used and expected_command == command and due_at <= fired_at <= due_at + tolerance:
+                match = i
+                break
+        if match is None:
+            false_triggers += 1
+        else:
+            used.add(match)
+            latencies.append(fired_at - expected[match][1])
+    return latencies, len(expected) - len(used), false_triggers
+
+
+def run_fixture(path, args, workdir):
+    """Replay one fixture through the real main loop and collect results"""
+    with open(os.path.splitext(path)[0] + '.json') as f:
+        spec = json.load(f)
+    audio = FixturePyAudio(path, speed=args.speed)
+    capture = CapturePipeline(sample_rate=audio.sample_rate, audio=audio, callback=not args.blocking)
+    detector = VoiceDetector(
+        start_command=spec.get('start_command', 'help'),
+        stop_command=spec.get('stop_command', 'stop'),
+        capture=capture,
+        engine=args.engine,
+        keywords_dir=args.keywords,
+        dispatcher=AlertDispatcher(transport=MemoryTransport("BENCH")),
+        continuous=args.continuous
+    )
+    recorder = AudioRecorder(pre_roll_seconds=args.pre_roll, capture=capture, directory=workdir)
+    recorder.arm()
+
+    # Note when start/stop_recording return, on the wall clock
+    triggers = []
+    for command, method_name in (("start", "start_recording"), ("stop", "stop_recording")):
+        method = getattr(recorder, method_name)
+
+        def timed(*args, method=method, command=command, **kwargs):
+            result = method(*args, **kwargs)
+            triggers.append((command, time.perf_counter()))
+            return result
+        setattr(recorder, method_name, timed)
+
+    stop_event = threading.Event()
+    loop = threading.Thread(
+        target=run,
+        args=(detector, recorder, detector.start_command, detector.stop_command, stop_event),
+        daemon=True
+    )
+    loop.start()
+
+    rss_start = rss_kb()
+    rss_peak_sampled = rss_start or 0
+    fixture_seconds = len(audio.pcm) / 2 / audio.sample_rate
+    deadline = audio.stream.wall_time(fixture_seconds + args.tail)
+    while time.perf_counter() < deadline:
+        time.sleep(0.2)
+        rss_peak_sampled = max(rss_peak_sampled, rss_kb() or 0)
+    # Subscriptions are removed on shutdown, so keep hold of their drop counts
+    subscriptions = list(capture._subscribers)
+    stopped_at = time.perf_counter()
+    stop_event.set()
+    loop.join(timeout=10)
+    if detector.continuous is not None:
+        detector.continuous.stop()
+    recorder.disarm()
+    capture.stop()
+
+    stream = audio.stream
+    expected = [(event['command'], stream.wall_time(event['time'])) for event in spec.get('events', [])]
+    # The loop stops any open recording on shutdown; that is not a trigger
+    triggers = [trigger for trigger in triggers if trigger[1] < stopped_at]
+    latencies, missed, false_triggers = match_triggers(expected, triggers, args.tolerance)
+    dropped = sum(subscription.dropped for subscription in subscriptions)
+    return {
+        "fixture": path,
+        "audio_seconds": fixture_seconds,
+        "expected_triggers": len(expected),
+        "latencies": latencies,
+        "missed_triggers": missed,
+        "false_triggers": false_triggers,
+        "overflowed_frames": stream.overflowed_frames,
+        "dropped_chunks": dropped,
+        "rss_start_kb": rss_start,
+        "rss_peak_kb": rss_peak_sampled
+    }
+
+
+def summarize(results):
+    latencies = [latency for result in results for latency in result["latencies"]]
+    return {
+        "fixtures": len(results),
+        "triggers_expected": sum(r["expected_triggers"] for r in results),
+        "latency_p50": percentile(latencies, 0.50),
+        "latency_p90": percentile(latencies, 0.90),
+        "latency_p99": percentile(latencies, 0.99),
+        "latency_max": max(latencies) if latencies else None,
+        "missed_triggers": sum(r["missed_triggers"] for r in results),
+        "false_triggers": sum(r["false_triggers"] for r in results),
+        "overflowed_frames": sum(r["overflowed_frames"] for r in results),
+        "dropped_chunks": sum(r["dropped_chunks"] for r in results),
+        # Peak RSS of the whole process (KiB on Linux)
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "results": results
+    }
+
+
+def print_report(summary):
+    def seconds(value):
+        return "n/a" if value is None else f"{value * 1000:.0f} ms"
+
+    print("\n=== Benchmark results ===")
+    for result in summary["results"]:
+        print(f"{result['fixture']}: {len(result['latencies'])}/{result['expected_triggers']} triggers, "
+              f"{result['missed_triggers']} missed, {result['false_triggers']} false, "
+              f"{result['overflowed_frames']} frames overflowed, {result['dropped_chunks']} chunks dropped, "
+              f"RSS {result['rss_start_kb']} -> {result['rss_peak_kb']} KiB")
+    print(f"Trigger latency: p50 {seconds(summary['latency_p50'])}, p90 {seconds(summary['latency_p90'])}, "
+          f"p99 {seconds(summary['latency_p99'])}, max {seconds(summary['latency_max'])}")
+    print(f"Missed triggers: {summary['missed_triggers']}  False triggers: {summary['false_triggers']}")
+    print(f"Frames lost: {summary['overflowed_frames']} overflowed, {summary['dropped_chunks']} chunks dropped")
+    print(f"Peak RSS: {summary['peak_rss_kb']} KiB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay fixture audio through the detection and recording loop")
+    parser.add_argument("fixtures", nargs="+", help="16-bit mono WAV files with JSON sidecars")
+    parser.add_argument("--engine", default="keyword", choices=["keyword", "google"])
+    parser.add_argument("--keywords", default="keywords", help="Keyword samples directory for the keyword engine")
+    parser.add_argument("--continuous", action="store_true", help="Use continuous windowed recognition")
+    parser.add_argument("--blocking", action="store_true", help="Capture with blocking reads instead of a callback")
+    parser.add_argument("--speed", type=float, default=1.0, help="Playback speed relative to real time")
+    parser.add_argument("--pre-roll", type=float, default=5.0, help="Recorder pre-roll in seconds")
+    parser.add_argument("--tolerance", type=float, default=5.0, help="Seconds after an event a trigger may match it")
+    parser.add_argument("--tail", type=float, default=3.0, help="Seconds to keep running after each fixture ends")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="stealthrec-bench-") as workdir:
+        results = [run_fixture(path, args, workdir) for path in args.fixtures]
+    summary = summarize(results)
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_report(summary)
+    return 0 if summary["missed_triggers"] == 0 and summary["false_triggers"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,324 @@
+import pyaudio
+import queue
+import threading
+import time
+from collections import deque
+from metrics import default_registry
+from ring_buffer import SPSCRingBuffer
+
+_CHUNKS = default_registry.counter("stealthrec_capture_chunks_total", "Audio chunks read from the input device")
+_BYTES = default_registry.counter("stealthrec_capture_bytes_total", "Audio bytes read from the input device")
+_OVERFLOWS = default_registry.counter(
+    "stealthrec_capture_overflows_total", "Input overflows, each losing at least one chunk of audio")
+
+
+class CaptureSubscription:
+    """Bounded queue of audio chunks fed by a CapturePipeline.
+
+    When a consumer falls behind, the oldest chunk is dropped (and counted)
+    so the capture thread never blocks on a slow subscriber.
+    """
+
+    def __init__(self, name, maxsize):
+        self.name = name
+        # Position in the capture stream (in frames) of the first chunk
+        # delivered, set by the pipeline
+        self.start_frame = None
+        self.dropped = 0
+        self.closed = False
+        self._queue = queue.Queue(maxsize)
+        self._dropped_metric = default_registry.counter(
+            "stealthrec_capture_chunks_dropped_total", "Chunks dropped because a subscriber fell behind",
+            subscriber=name)
+
+    def put(self, chunk):
+        """Queue a chunk, discarding the oldest one if the queue is full"""
+        try:
+            self._queue.put_nowait(chunk)
+        except queue.Full:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            self.dropped += 1
+            self._dropped_metric.inc()
+            self._queue.put_nowait(chunk)
+
+    def read(self, size=None):
+        """Return the next chunk, or b'' once the subscription is closed.
+
+        Blocks like a stream read, so the subscription can stand in for
+        a PyAudio stream.
+        """
+        while not self.closed:
+            try:
+                return self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+        return b''
+
+    def close(self):
+        """Stop delivering chunks and wake up a blocked reader"""
+        self.closed = True
+
+
+class CapturePipeline:
+    """Own the input device and fan each captured chunk out to subscribers.
+
+    The device is opened once by a single capture thread; the voice
+    detector, the recorder and any other consumer each get their own
+    CaptureSubscription, so adding a consumer only costs a queue.
+
+    By default PyAudio delivers audio through a stream callback that only
+    copies each buffer into a preallocated SPSCRingBuffer; the capture
+    thread drains the ring in batches and does the fan-out. The real-time
+    path then never allocates a buffer or takes a lock, and keeps up even
+    when recognition or the UI hold the GIL for a while. With
+    callback=False the capture thread reads the stream in blocking mode.
+
+    device_index selects an input device other than the default. Every
+    anchor_interval seconds the pipeline notes (frame, time.monotonic())
+    for the newest captured frame in clock_anchors, so streams from
+    different devices can be lined up and their clock drift measured.
+    """
+
+    def __init__(self, sample_rate=44100, chunk_size=1024, channels=1, audio=None, callback=True,
+                 ring_seconds=2.0, simulate=False, device_index=None, anchor_interval=1.0,
+                 anchor_history=21600):
+        self.is_simulation_mode = False
+        self.device_index = device_index
+        self.device_name = None
+        if simulate:
+            # Skip the device check (e.g. for the virtual-time simulation driver)
+            self._setup_simulation_mode()
+        else:
+            self._open_audio(audio)
+
+        self.sample_rate = sample_rate
+        self.chunk_size = chunk_size
+        self.channels = channels
+        self.format = pyaudio.paInt16
+        self.callback = callback
+        self.ring_seconds = ring_seconds
+        self._ring = None
+        # Overflows flagged by the device, counted in the audio callback
+        self.device_overflows = 0
+        # Frames handed to subscribers so far, and (frame, monotonic time)
+        # samples of the stream position
+        self.frames_published = 0
+        self.anchor_interval = anchor_interval
+        self.clock_anchors = deque(maxlen=anchor_history)
+        self._last_anchor = float('-inf')
+        # (ring byte position, monotonic time) of the end of the newest
+        # buffer given to the callback
+        self._callback_mark = None
+        self.stream = None
+        self.is_running = False
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _open_audio(self, audio):
+        """Check for an input device, falling back to simulation mode"""
+        try:
+            # A stand-in for pyaudio.PyAudio can be passed in (e.g. to replay
+            # recorded audio in benchmarks)
+            self.audio = audio if audio is not None else pyaudio.PyAudio()
+            # Get default input device info
+            device_count = self.audio.get_host_api_info_by_index(0).get('deviceCount')
+            if device_count == 0:
+                print("\nNo audio input devices found. Entering simulation mode.")
+                self._setup_simulation_mode()
+            else:
+                # Try to use the selected or the default input device
+                try:
+                    if self.device_index is not None:
+                        device = self.audio.get_device_info_by_index(self.device_index)
+                        if device.get('maxInputChannels', 0) < 1:
+                            raise OSError(f"device {self.device_index} has no inputs")
+                    else:
+                        device = self.audio.get_default_input_device_info()
+                    self.device_name = device.get('name')
+                    print(f"\nUsing audio input device: {self.device_name}")
+                except Exception:
+                    print("\nCould not access audio device. Entering simulation mode.")
+                    self._setup_simulation_mode()
+        except Exception as e:
+            print(f"\nWarning: Error initializing audio system: {str(e)}")
+            print("Entering simulation mode.")
+            self._setup_simulation_mode()
+
+    def _setup_simulation_mode(self):
+        """Set up simulation mode for testing"""
+        self.is_simulation_mode = True
+        self.audio = pyaudio.PyAudio()
+
+    @property
+    def sample_width(self):
+        return self.audio.get_sample_size(self.format)
+
+    def subscribe(self, name, maxsize=64):
+        """Register a consumer and return its subscription queue"""
+        subscription = CaptureSubscription(name, maxsize)
+        with self._lock:
+            # Copy on write, so the capture thread can iterate without locking
+            self._subscribers = self._subscribers + [subscription]
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Remove a consumer and close its queue"""
+        with self._lock:
+            self._subscribers = [s for s in self._subscribers if s is not subscription]
+        subscription.close()
+
+    def start(self):
+        """Open the input device and start the capture thread"""
+        # Consumers may start the pipeline from several threads at once;
+        # only the first may open the device
+        with self._lock:
+            return self._start()
+
+    def _start(self):
+        if self.is_running or self.is_simulation_mode:
+            return self.is_running
+        if self.stream is not None:
+            # Left open by a capture that ended with a device error
+            self._close_stream()
+        # Subscriptions closed by that error are finished with
+        self._subscribers = [s for s in self._subscribers if not s.closed]
+
+        options = {}
+        if self.callback:
+            if self._ring is None:
+                frame_bytes = self.sample_width * self.channels
+                self._ring = SPSCRingBuffer(int(self.ring_seconds * self.sample_rate) * frame_bytes)
+            options["stream_callback"] = self._on_audio
+        if self.device_index is not None:
+            options["input_device_index"] = self.device_index
+        self.stream = self.audio.open(
+            format=self.format,
+            channels=self.channels,
+            rate=self.sample_rate,
+            input=True,
+            frames_per_buffer=self.chunk_size,
+            **options
+        )
+        self.is_running = True
+        self._thread = threading.Thread(target=self._drain if self.callback else self._run, daemon=True)
+        self._thread.start()
+        return True
+
+    def _on_audio(self, in_data, frame_count, time_info, status_flags):
+        """PyAudio stream callback: copy the buffer into the ring and return"""
+        if status_flags & pyaudio.paInputOverflow:
+            self.device_overflows += 1
+        # Note where this buffer will end before publishing its bytes, in
+        # one assignment, so the drain thread never pairs a time with the
+        # wrong position (a dropped buffer's mark is never reached)
+        self._callback_mark = (self._ring.total_written + len(in_data), time.monotonic())
+        self._ring.write(in_data)
+        return (None, pyaudio.paContinue)
+
+    def _drain(self):
+        """Move whole chunks from the callback ring to every subscriber"""
+        chunk_bytes = self.chunk_size * self.sample_width * self.channels
+        # Wake up about twice per chunk; everything ready is taken at once
+        interval = self.chunk_size / self.sample_rate / 2
+        ring = self._ring
+        reported = self.device_overflows + ring.overruns
+        while self.is_running:
+            ready = ring.available() // chunk_bytes
+            for _ in range(ready):
+                self._publish(ring.read(chunk_bytes))
+            self._anchor_callback(ring)
+
+            lost = self.device_overflows + ring.overruns
+            if lost != reported:
+                _OVERFLOWS.inc(lost - reported)
+                reported = lost
+            if ready:
+                continue
+            if not self.stream.is_active():
+                self._fail("audio stream stopped")
+                break
+            time.sleep(interval)
+
+    def _publish(self, data):
+        """Hand one chunk to every subscriber"""
+        _CHUNKS.inc()
+        _BYTES.inc(len(data))
+        frame = self.frames_published
+        for subscription in self._subscribers:
+            if subscription.start_frame is None:
+                subscription.start_frame = frame
+            subscription.put(data)
+        self.frames_published = frame + len(data) // (self.sample_width * self.channels)
+
+    def _anchor(self, frame, at):
+        """Note that stream frame `frame` was captured at monotonic time `at`"""
+        if at - self._last_anchor >= self.anchor_interval:
+            self.clock_anchors.append((frame, at))
+            self._last_anchor = at
+
+    def _anchor_callback(self, ring):
+        """Anchor the last frame of the newest buffer delivered to the
+        callback (the ring holds the frames captured but not yet published)"""
+        mark = self._callback_mark
+        if mark is None:
+            return
+        position, at = mark
+        if at - self._last_anchor < self.anchor_interval or position > ring.total_written:
+            return
+        unread = position - ring.total_read
+        self._anchor(self.frames_published + unread // (self.sample_width * self.channels), at)
+
+    def _fail(self, reason):
+        """End capture after a device error and wake up consumers"""
+        print(f"\nError capturing audio: {reason}")
+        self.is_running = False
+        # Wake up consumers so they notice the capture has ended
+        for subscription in self._subscribers:
+            subscription.close()
+
+    def _run(self):
+        """Read chunks from the device and hand them to every subscriber"""
+        while self.is_running:
+            try:
+                # Raising on overflow would make PyAudio throw away a chunk
+                # it read correctly, so overflows are only counted in
+                # callback mode, where the device flags them
+                data = self.stream.read(self.chunk_size, exception_on_overflow=False)
+            except Exception as e:
+                self._fail(str(e))
+                break
+
+            self._publish(data)
+            self._anchor(self.frames_published, time.monotonic())
+
+    def stop(self):
+        """Stop the capture thread and close the input device"""
+        with self._lock:
+            self.is_running = False
+            if self._thread and self._thread.is_alive() and self._thread is not threading.current_thread():
+                self._thread.join(timeout=2.0)
+            self._close_stream()
+
+    def _close_stream(self):
+        """Close the device stream and forget the audio left over from it"""
+        if self.stream:
+            try:
+                self.stream.stop_stream()
+                self.stream.close()
+            except Exception as e:
+                # A stream that failed may not close cleanly
+                print(f"\nWarning: Error closing audio stream: {str(e)}")
+            self.stream = None
+        if self._ring is not None:
+            # Audio left over from this run must not leak into the next
+            self._ring.clear()
+        self._callback_mark = None
+
+    def terminate(self):
+        """Release the device and the PyAudio instance"""
+        self.stop()
+        self.audio.terminate()
@@ -0,0 +1,229 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+
+
+class RecordingSummary:
+    """Checksum and peak/RMS envelope of a recording, built chunk by chunk.
+
+    The recorder feeds every chunk it writes, so the summary is ready the
+    moment the recording stops and the audio never has to be read back.
+    The envelope holds one peak and one RMS value per bin
+    (bins_per_second bins per second of audio), which is enough to draw a
+    waveform of any length.
+    """
+
+    def __init__(self, sample_rate, channels=1, bins_per_second=20):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.bins_per_second = bins_per_second
+        self.bin_samples = max(1, sample_rate // bins_per_second) * channels
+        self.bytes = 0
+        self._hash = hashlib.sha256()
+        self._pending = bytearray()
+        self._peaks = []
+        self._rms = []
+
+    @property
+    def duration(self):
+        """Seconds of audio seen so far"""
+        return self.bytes / 2 / self.channels / self.sample_rate
+
+    @property
+    def checksum(self):
+        """SHA-256 of the PCM data"""
+        return self._hash.hexdigest()
+
+    def update(self, data):
+        self._hash.update(data)
+        self.bytes += len(data)
+        self._pending += data
+        bin_bytes = self.bin_samples * 2
+        whole = len(self._pending) // bin_bytes
+        if whole:
+            self._add_bins(bytes(self._pending[:whole * bin_bytes]), whole)
+            del self._pending[:whole * bin_bytes]
+
+    def _add_bins(self, pcm, count):
+        samples = np.frombuffer(pcm, dtype=np.int16).reshape(count, -1).astype(np.float32)
+        self._peaks.append(np.abs(samples).max(axis=1))
+        self._rms.append(np.sqrt(np.mean(samples * samples, axis=1)))
+
+    def envelope(self):
+        """Return (peaks, rms) as int16 arrays, including a final partial bin"""
+        peaks, rms = list(self._peaks), list(self._rms)
+        usable = len(self._pending) // 2 * 2
+        if usable:
+            samples = np.frombuffer(bytes(self._pending[:usable]), dtype=np.int16).astype(np.float32)
+            peaks.append(np.abs(samples).max(keepdims=True))
+            rms.append(np.sqrt(np.mean(samples * samples, keepdims=True)))
+        if not peaks:
+            return np.zeros(0, dtype=np.int16), np.zeros(0, dtype=np.int16)
+        return (np.minimum(np.concatenate(peaks), 32767).astype(np.int16),
+                np.minimum(np.concatenate(rms), 32767).astype(np.int16))
+
+
+class CatalogEntry:
+    """One cataloged recording (the envelope is loaded separately)"""
+
+    def __init__(self, id, path, started_at, triggered_at, stopped_at, trigger, duration, size,
+                 sample_rate, channels, checksum):
+        self.id = id
+        self.path = path
+        self.started_at = started_at
+        self.triggered_at = triggered_at
+        self.stopped_at = stopped_at
+        self.trigger = trigger
+        self.duration = duration
+        self.size = size
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.checksum = checksum
+
+    def __repr__(self):
+        return f"CatalogEntry(path={self.path!r}, duration={self.duration:.1f}s, trigger={self.trigger!r})"
+
+
+_COLUMNS = ("id, path, started_at, triggered_at, stopped_at, trigger, duration, size, "
+            "sample_rate, channels, checksum")
+
+
+class RecordingCatalog:
+    """
+    SQLite index of saved recordings.
+    A row is added as each recording is saved, holding its times, trigger
+    source, duration, size, checksum and waveform envelope, so listing,
+    searching by time and drawing waveforms never open the audio files.
+    Like the alert outbox it runs in WAL mode with synchronous=NORMAL.
+    """
+
+    def __init__(self, path=os.path.join("recordings", "catalog.db")):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS recordings (
+                id INTEGER PRIMARY KEY,
+                path TEXT NOT NULL UNIQUE,
+                started_at REAL NOT NULL,
+                triggered_at REAL,
+                stopped_at REAL NOT NULL,
+                trigger TEXT,
+                duration REAL NOT NULL,
+                size INTEGER NOT NULL,
+                sample_rate INTEGER NOT NULL,
+                channels INTEGER NOT NULL,
+                checksum TEXT NOT NULL,
+                bins_per_second INTEGER NOT NULL,
+                envelope BLOB NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS recordings_started ON recordings (started_at)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS recordings_stopped ON recordings (stopped_at)")
+        self._db.commit()
+
+    def add(self, path, summary, stopped_at=None, trigger=None, triggered_at=None, size=None):
+        """Catalog a saved recording and return its id"""
+        stopped_at = time.time() if stopped_at is None else stopped_at
+        peaks, rms = summary.envelope()
+        # Interleaved peak/RMS pairs, little-endian int16
+        envelope = np.stack((peaks, rms), axis=1).astype('<i2').tobytes()
+        if size is None:
+            size = recording_size(path)
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT OR REPLACE INTO recordings (path, started_at, triggered_at, stopped_at, trigger, duration, "
+                "size, sample_rate, channels, checksum, bins_per_second, envelope) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (path, stopped_at - summary.duration, triggered_at, stopped_at, trigger, summary.duration, size,
+                 summary.sample_rate, summary.channels, summary.checksum, summary.bins_per_second, envelope)
+            )
+            self._db.commit()
+            return cursor.lastrowid
+
+    def _entries(self, where="", params=(), limit=None):
+        query = f"SELECT {_COLUMNS} FROM recordings {where} ORDER BY started_at DESC"
+        if limit is not None:
+            query += f" LIMIT {int(limit)}"
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        return [CatalogEntry(*row) for row in rows]
+
+    def recent(self, limit=50):
+        """Most recent recordings first"""
+        return self._entries(limit=limit)
+
+    def between(self, start, end):
+        """Recordings with any audio between the two timestamps"""
+        return self._entries("WHERE started_at < ? AND stopped_at > ?", (end, start))
+
+    def get(self, path):
+        """Entry for a recording path, or None"""
+        entries = self._entries("WHERE path = ?", (path,))
+        return entries[0] if entries else None
+
+    def envelope(self, entry_id):
+        """Return (peaks, rms, bins_per_second) for drawing a waveform"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT envelope, bins_per_second FROM recordings WHERE id = ?", (entry_id,)).fetchone()
+        if row is None:
+            raise KeyError(entry_id)
+        pairs = np.frombuffer(row[0], dtype='<i2').reshape(-1, 2)
+        return pairs[:, 0], pairs[:, 1], row[1]
+
+    def index_file(self, path, trigger="import"):
+        """Catalog a WAV file or segmented session (by its manifest.json)
+        saved before the catalog existed"""
+        from wav_reader import open_recording
+        with open_recording(path) as reader:
+            summary = RecordingSummary(reader.sample_rate, reader.channels)
+            for view in reader.views():
+                for offset in range(0, len(view), 65536):
+                    summary.update(view[offset:offset + 65536].tobytes())
+        return self.add(path, summary, stopped_at=os.path.getmtime(path), trigger=trigger)
+
+    def index_directory(self, directory="recordings"):
+        """Catalog every recording under directory not already cataloged:
+        WAV files and segmented sessions, which are cataloged by manifest"""
+        with self._lock:
+            known = {row[0] for row in self._db.execute("SELECT path FROM recordings")}
+        recordings = []
+        for folder, folders, names in os.walk(directory):
+            folders.sort()
+            if folder != directory and "manifest.json" in names:
+                # A segmented session; its segments are not recordings of their own
+                recordings.append(os.path.join(folder, "manifest.json"))
+                folders[:] = []
+                continue
+            recordings.extend(os.path.join(folder, name) for name in sorted(names) if name.lower().endswith('.wav'))
+        added = 0
+        for path in recordings:
+            if path in known:
+                continue
+            try:
+                self.index_file(path)
+                added += 1
+            except Exception as e:
+                print(f"\nError cataloging {path}: {str(e)}")
+        return added
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def recording_size(path):
+    """Bytes on disk of a recording: one file, or every segment in a manifest"""
+    if os.path.basename(path) != "manifest.json":
+        return os.path.getsize(path)
+    directory = os.path.dirname(path)
+    with open(path) as f:
+        manifest = json.load(f)
+    return sum(os.path.getsize(os.path.join(directory, segment["file"])) for segment in manifest["segments"])
@@ -0,0 +1,59 @@
+import threading
+import time
+
+
+class SystemClock:
+    """Wall-clock time, used everywhere outside of simulations"""
+
+    def time(self):
+        return time.time()
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def sleep_until(self, deadline):
+        """Sleep until monotonic() reaches deadline"""
+        self.sleep(deadline - time.monotonic())
+
+
+class VirtualClock:
+    """A clock that only moves when advanced.
+
+    Threads sleeping on it wake as soon as advance() or advance_to()
+    passes their deadline, so a driver can skip through hours of
+    simulated time without waiting. time() counts from epoch (the real
+    time when the clock was created, by default), so timestamps and
+    file names still look like wall-clock times.
+    """
+
+    def __init__(self, epoch=None):
+        self.epoch = time.time() if epoch is None else epoch
+        self._now = 0.0
+        self._cond = threading.Condition()
+
+    def time(self):
+        return self.epoch + self._now
+
+    def monotonic(self):
+        return self._now
+
+    def sleep(self, seconds):
+        self.sleep_until(self._now + seconds)
+
+    def sleep_until(self, deadline):
+        with self._cond:
+            self._cond.wait_for(lambda: self._now >= deadline)
+
+    def advance(self, seconds):
+        self.advance_to(self._now + seconds)
+
+    def advance_to(self, now):
+        """Move the clock forward to monotonic time now and wake sleepers"""
+        with self._cond:
+            if now > self._now:
+                self._now = now
+                self._cond.notify_all()
@@ -0,0 +1,144 @@
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ContinuousRecognizer:
+    """Recognize commands from a CapturePipeline without gaps.
+
+    Captured audio is cut into overlapping windows (window_seconds long,
+    one every hop_seconds) that are recognized on a thread pool while
+    capture keeps running, so speech is never missed while a previous
+    window is being recognized. Results are released in window order,
+    and a command heard in two overlapping windows fires only once.
+
+    If recognition falls behind, windows that have not started yet are
+    dropped (oldest first) so at most `max_pending` are outstanding and
+    time-to-detection stays bounded.
+
+    `recognize(pcm)` turns raw window audio into text (or None) and
+    `match(text)` turns text into a command (or None).
+    """
+
+    def __init__(self, capture, recognize, match, window_seconds=2.0, hop_seconds=1.0,
+                 workers=2, max_pending=4):
+        self.capture = capture
+        self.recognize = recognize
+        self.match = match
+        self.window_seconds = window_seconds
+        self.hop_seconds = hop_seconds
+        self.workers = workers
+        self.max_pending = max_pending
+        self.windows_submitted = 0
+        self.windows_skipped = 0
+        self.duplicates_suppressed = 0
+        self._commands = queue.Queue()
+        self._pending = deque()
+        # Reentrant: cancelling a window runs its done callback right away
+        self._lock = threading.RLock()
+        self._last_command = None
+        self._last_end = 0
+        self._subscription = None
+        self._pool = None
+        self._thread = None
+
+    def start(self):
+        """Subscribe to the capture pipeline and start windowing"""
+        if self._thread is not None:
+            return
+        # Enough headroom that the windowing thread never loses audio
+        maxsize = int(4 * self.window_seconds * self.capture.sample_rate / self.capture.chunk_size)
+        self._subscription = self.capture.subscribe("continuous-recognizer", maxsize=maxsize)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="recognizer")
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self.capture.start()
+
+    def stop(self):
+        """Stop windowing and wait for in-flight recognitions"""
+        if self._thread is None:
+            return
+        self.capture.unsubscribe(self._subscription)
+        self._thread.join(timeout=2.0)
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        self._thread = None
+
+    def get(self, timeout=None):
+        """Return the next detected command, or None after `timeout`"""
+        try:
+            return self._commands.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _run(self):
+        """Cut the captured stream into overlapping windows"""
+        frame_bytes = self.capture.sample_width * self.capture.channels
+        window_bytes = int(self.window_seconds * self.capture.sample_rate) * frame_bytes
+        hop_bytes = int(self.hop_seconds * self.capture.sample_rate) * frame_bytes
+        buffer = bytearray()
+        # Stream position (in bytes) of buffer[0] and of the next window
+        offset = 0
+        next_start = 0
+        sequence = 0
+
+        while True:
+            chunk = self._subscription.read()
+            if not chunk:
+                break
+            buffer += chunk
+            while offset + len(buffer) - next_start >= window_bytes:
+                begin = next_start - offset
+                window = bytes(buffer[begin:begin + window_bytes])
+                self._submit(sequence, next_start // frame_bytes, (next_start + window_bytes) // frame_bytes, window)
+                sequence += 1
+                next_start += hop_bytes
+            # Audio before the next window start is no longer needed
+            if next_start > offset:
+                del buffer[:next_start - offset]
+                offset = next_start
+
+    def _submit(self, sequence, start_frame, end_frame, window):
+        future = self._pool.submit(self._recognize_window, window)
+        with self._lock:
+            self._pending.append((sequence, start_frame, end_frame, future))
+            self.windows_submitted += 1
+            # Drop the oldest windows that have not started if we are behind;
+            # finished windows waiting to be released in order do not count,
+            # and the window just submitted is always kept
+            live = sum(1 for item in self._pending if not item[3].done())
+            waiting = [item for item in self._pending
+                       if item[3] is not future and not item[3].running() and not item[3].done()]
+            for item in waiting[:max(0, live - self.max_pending)]:
+                if item[3].cancel():
+                    self.windows_skipped += 1
+            # Skipped windows have nothing to release
+            self._pending = deque(item for item in self._pending if not item[3].cancelled())
+        future.add_done_callback(lambda _: self._release())
+
+    def _recognize_window(self, window):
+        try:
+            return self.recognize(window)
+        except Exception as e:
+            print(f"\nError in continuous recognition: {str(e)}")
+            return None
+
+    def _release(self):
+        """Deliver finished windows in order, suppressing duplicates"""
+        with self._lock:
+            while self._pending and self._pending[0][3].done():
+                _, start_frame, end_frame, future = self._pending.popleft()
+                if future.cancelled():
+                    continue
+                text = future.result()
+                command = self.match(text) if text else None
+                if command is None:
+                    continue
+                if command == self._last_command and start_frame < self._last_end:
+                    # Same utterance seen again by an overlapping window
+                    self.duplicates_suppressed += 1
+                    self._last_end = end_frame
+                    continue
+                self._last_command = command
+                self._last_end = end_frame
+                self._commands.put(command)
@@ -0,0 +1,81 @@
+import os
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+
+class RecordingEncoder:
+    """Compress finished WAV files to FLAC on a background worker.
+
+    Encoding runs off the capture path, one file at a time by default.
+    Each result reports the compression ratio and the CPU time spent per
+    second of audio, and running totals are kept in `stats`.
+    FLAC encoding uses the optional `soundfile` package (libsndfile).
+    """
+
+    def __init__(self, keep_source=True, workers=1, on_encoded=None):
+        import soundfile
+        self._soundfile = soundfile
+        self.keep_source = keep_source
+        self.on_encoded = on_encoded
+        self.stats = {"files": 0, "input_bytes": 0, "output_bytes": 0, "audio_seconds": 0.0, "cpu_seconds": 0.0}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="encoder")
+
+    def submit(self, path):
+        """Queue a WAV file for encoding; returns a Future of the result"""
+        return self._pool.submit(self._encode, path)
+
+    def _encode(self, path):
+        started = time.thread_time()
+        try:
+            with wave.open(path, 'rb') as wf:
+                frames = wf.getnframes()
+                sample_rate = wf.getframerate()
+            output = os.path.splitext(path)[0] + ".flac"
+            data, rate = self._soundfile.read(path, dtype='int16')
+            self._soundfile.write(output, data, rate, format='FLAC', subtype='PCM_16')
+        except Exception as e:
+            print(f"\nError encoding {path}: {str(e)}")
+            return None
+
+        cpu_seconds = time.thread_time() - started
+        audio_seconds = frames / sample_rate if sample_rate else 0.0
+        input_bytes = os.path.getsize(path)
+        output_bytes = os.path.getsize(output)
+        result = {
+            "source": path,
+            "output": output,
+            "input_bytes": input_bytes,
+            "output_bytes": output_bytes,
+            "compression_ratio": input_bytes / output_bytes if output_bytes else 0.0,
+            "audio_seconds": audio_seconds,
+            "cpu_seconds": cpu_seconds,
+            "cpu_per_audio_second": cpu_seconds / audio_seconds if audio_seconds else 0.0
+        }
+        with self._lock:
+            self.stats["files"] += 1
+            self.stats["input_bytes"] += input_bytes
+            self.stats["output_bytes"] += output_bytes
+            self.stats["audio_seconds"] += audio_seconds
+            self.stats["cpu_seconds"] += cpu_seconds
+
+        print(f"\nEncoded {output}: {result['compression_ratio']:.2f}x smaller, "
+              f"{result['cpu_per_audio_second'] * 1000:.1f} ms CPU per second of audio")
+        if not self.keep_source:
+            os.remove(path)
+        if self.on_encoded:
+            self.on_encoded(result)
+        return result
+
+    def summary(self):
+        """Overall compression ratio and CPU cost of everything encoded"""
+        with self._lock:
+            stats = dict(self.stats)
+        stats["compression_ratio"] = stats["input_bytes"] / stats["output_bytes"] if stats["output_bytes"] else 0.0
+        stats["cpu_per_audio_second"] = stats["cpu_seconds"] / stats["audio_seconds"] if stats["audio_seconds"] else 0.0
+        return stats
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
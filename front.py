@@ -1,4 +1,6 @@
-from main import main
+import os
+from backend import Backend
+from kivy.clock import Clock
 from kivy.lang import Builder
 from kivy.uix.screenmanager import Screen, ScreenManager
 from kivy.core.window import Window
@@ -118,6 +120,14 @@ ScreenManager:
             pos_hint: {"center_x": 0.5}
             md_bg_color: 1, 0.3, 0, 1  
             on_release: root.stop_recording()
+
+        MDRaisedButton:
+            text: "Re-arm"
+            size_hint: None, None
+            size: dp(120), dp(40)
+            pos_hint: {"center_x": 0.5}
+            md_bg_color: 0.2, 0.2, 0.2, 1  
+            on_release: root.rearm()
 """
 
 class EntryScreen(Screen):
@@ -138,24 +148,79 @@ class ProfileScreen(Screen):
         self.sen_number = sen_number
 
         try:
-            main(start_command, stop_command, sen_number)
+            # The backend listens on its own threads; the UI only polls it
+            app = MDApp.get_running_app()
+            # The old backend is shut down on the new one's thread, so a
+            # save in progress never freezes the UI
+            previous, app.backend = app.backend, Backend(start_command, stop_command, sen_number)
+            app.backend.start(replacing=previous)
             Snackbar(text="Profile saved and backend started!").open()
 
             # Switch to RecordingScreen
-            self.manager.get_screen("recording").status = "Waiting for command to start recording..."
+            self.manager.get_screen("recording").status = "Starting backend..."
             self.manager.current = "recording"
         except Exception as e:
             Snackbar(text=f"Error starting backend: {e}").open()
 
 class RecordingScreen(Screen):
     status = StringProperty("Waiting for command to start recording...")
+    _poll_event = None
+
+    def on_enter(self):
+        # Drain backend events ten times a second without blocking the UI
+        self._poll_event = Clock.schedule_interval(self.poll_backend, 0.1)
+
+    def on_leave(self):
+        if self._poll_event is not None:
+            self._poll_event.cancel()
+            self._poll_event = None
+
+    def poll_backend(self, dt):
+        backend = MDApp.get_running_app().backend
+        if backend is None:
+            return
+        for event, detail in backend.poll():
+            self.handle_event(event, detail)
+
+    def handle_event(self, event, detail):
+        """Reflect a backend state change in the UI"""
+        if event == "initializing":
+            self.status = "Starting backend..."
+        elif event in ("ready", "armed"):
+            self.status = "Waiting for command to start recording..."
+        elif event == "recording_started":
+            self.status = "Recording..."
+        elif event == "state" and detail == "saving":
+            self.status = "Saving recording..."
+        elif event == "recording_stopped":
+            self.status = "Recording stopped!"
+            if detail:
+                Snackbar(text=f"Saved {os.path.basename(detail)}").open()
+        elif event == "error":
+            Snackbar(text=f"Error: {detail}").open()
+        elif event == "stopped":
+            self.status = "Backend stopped."
 
     def stop_recording(self):
-        # Logic to stop the recording or handle backend interaction
-        self.status = "Recording stopped!"
-        Snackbar(text="Recording has been stopped.").open()
+        backend = MDApp.get_running_app().backend
+        if backend is None:
+            Snackbar(text="The backend is not running.").open()
+            return
+        backend.send("stop_recording")
+
+    def rearm(self):
+        backend = MDApp.get_running_app().backend
+        if backend is not None:
+            backend.send("rearm")
 
 class StealthRec(MDApp):
+    backend = None
+
+    def on_stop(self):
+        # Finish any recording in progress before the window closes
+        if self.backend is not None:
+            self.backend.shutdown()
+
     def build(self):
         self.theme_cls.theme_style = "Dark"
         self.theme_cls.primary_palette = "Orange"
@@ -0,0 +1,209 @@
+"""
+Tamper-evident integrity manifests for recordings.
+
+A HashChain is fed the PCM of a recording as it is written and hashes
+it in fixed-size blocks; each block hash is chained onto the previous
+head (head = SHA-256(head + block hash)), so the final head commits to
+every block and to their order. At stop the block hashes and the head
+are saved as a JSON manifest next to the recording, optionally signed
+with an HMAC key, and verify_recording() checks a recording against it
+block by block, reporting how much of a damaged file is still intact.
+
+Usage:
+    python integrity.py recordings/recording_20250101_120000.wav [--key-file secret.key]
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import sys
+
+# PCM bytes per hashed block (about 2 seconds of 16 kHz mono audio)
+BLOCK_SIZE = 65536
+
+_GENESIS = bytes(32)
+
+
+class HashChain:
+    """Block hashes and running chain head of PCM written so far"""
+
+    def __init__(self, block_size=BLOCK_SIZE):
+        self.block_size = block_size
+        self.bytes = 0
+        self.blocks = []
+        self.head = _GENESIS
+        self._block = hashlib.sha256()
+        self._block_bytes = 0
+
+    def update(self, data):
+        data = memoryview(data).cast('B')
+        self.bytes += len(data)
+        while len(data):
+            take = min(len(data), self.block_size - self._block_bytes)
+            self._block.update(data[:take])
+            self._block_bytes += take
+            data = data[take:]
+            if self._block_bytes == self.block_size:
+                self._close_block()
+
+    def _close_block(self):
+        digest = self._block.digest()
+        self.blocks.append(digest)
+        self.head = hashlib.sha256(self.head + digest).digest()
+        self._block = hashlib.sha256()
+        self._block_bytes = 0
+
+    def manifest(self, sample_rate, channels, key=None):
+        """Close the final partial block and return the manifest as a dict"""
+        if self._block_bytes:
+            self._close_block()
+        manifest = {
+            "version": 1,
+            "algorithm": "sha256-chain",
+            "block_size": self.block_size,
+            "bytes": self.bytes,
+            "sample_rate": sample_rate,
+            "channels": channels,
+            "blocks": [digest.hex() for digest in self.blocks],
+            "head": self.head.hex(),
+        }
+        if key is not None:
+            manifest["signature"] = {"algorithm": "hmac-sha256", "value": sign(manifest, key)}
+        return manifest
+
+
+def _canonical(manifest):
+    """The manifest bytes covered by a signature"""
+    unsigned = {name: value for name, value in manifest.items() if name != "signature"}
+    return json.dumps(unsigned, sort_keys=True, separators=(",", ":")).encode()
+
+
+def sign(manifest, key):
+    """HMAC-SHA256 of the manifest (without its signature) as hex"""
+    return hmac.new(key, _canonical(manifest), hashlib.sha256).hexdigest()
+
+
+def manifest_path(recording_path):
+    """Where the integrity manifest of a recording (file or segmented session) is kept"""
+    if os.path.isdir(recording_path):
+        return os.path.join(recording_path, "integrity.json")
+    if os.path.basename(recording_path) == "manifest.json":
+        return os.path.join(os.path.dirname(recording_path), "integrity.json")
+    return os.path.splitext(recording_path)[0] + ".integrity.json"
+
+
+def write_manifest(recording_path, manifest):
+    """Save a manifest next to its recording; returns the manifest path"""
+    path = manifest_path(recording_path)
+    temp_path = path + ".tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(temp_path, path)
+    return path
+
+
+class VerificationResult:
+    """Outcome of verify_recording(); bytes_verified is the intact prefix"""
+
+    def __init__(self, ok, blocks_verified, total_blocks, bytes_verified, error=None):
+        self.ok = ok
+        self.blocks_verified = blocks_verified
+        self.total_blocks = total_blocks
+        self.bytes_verified = bytes_verified
+        self.error = error
+
+    def __repr__(self):
+        if self.ok:
+            return f"VerificationResult(ok, {self.total_blocks} blocks)"
+        return (f"VerificationResult(failed after {self.blocks_verified}/{self.total_blocks} blocks, "
+                f"{self.bytes_verified} bytes intact: {self.error})")
+
+
+def _pcm_blocks(recording_path, block_size):
+    """Yield the PCM of a recording in block_size pieces, without copying
+    more than a block that spans two segments"""
+    from wav_reader import open_recording
+    with open_recording(recording_path) as reader:
+        pending = b''
+        for view in reader.views():
+            data = memoryview(view).cast('B')
+            if pending:
+                take = block_size - len(pending)
+                pending += bytes(data[:take])
+                data = data[take:]
+                if len(pending) < block_size:
+                    continue
+                yield pending
+                pending = b''
+            whole = len(data) - len(data) % block_size
+            for offset in range(0, whole, block_size):
+                yield data[offset:offset + block_size]
+            pending = bytes(data[whole:])
+        if pending:
+            yield pending
+
+
+def verify_recording(recording_path, key=None, manifest=None):
+    """Check a recording against its integrity manifest.
+
+    With a key the manifest's signature must match. Blocks are compared
+    in order and checking stops at the first one that differs, so a
+    damaged or truncated file is still vouched for up to that block.
+    """
+    if manifest is None:
+        with open(manifest_path(recording_path)) as f:
+            manifest = json.load(f)
+    blocks = [bytes.fromhex(digest) for digest in manifest["blocks"]]
+    total = len(blocks)
+    if key is not None:
+        signature = manifest.get("signature", {}).get("value")
+        if signature is None or not hmac.compare_digest(signature, sign(manifest, key)):
+            return VerificationResult(False, 0, total, 0, "signature does not match")
+    head = _GENESIS
+    for digest in blocks:
+        head = hashlib.sha256(head + digest).digest()
+    if head.hex() != manifest["head"]:
+        return VerificationResult(False, 0, total, 0, "block list does not match the chain head")
+
+    block_size = manifest["block_size"]
+    verified = 0
+    verified_bytes = 0
+    for block in _pcm_blocks(recording_path, block_size):
+        if verified == total:
+            return VerificationResult(False, verified, total, verified_bytes, "audio continues past the manifest")
+        if hashlib.sha256(block).digest() != blocks[verified]:
+            return VerificationResult(False, verified, total, verified_bytes,
+                                      f"block {verified} (byte {verified_bytes}) does not match")
+        verified += 1
+        verified_bytes += len(block)
+    if verified < total:
+        return VerificationResult(False, verified, total, verified_bytes, "audio ends before the manifest does")
+    return VerificationResult(True, verified, total, verified_bytes)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verify recordings against their integrity manifests")
+    parser.add_argument("recordings", nargs="+", help="WAV files or segmented session manifests")
+    parser.add_argument("--key-file", help="File holding the HMAC key the manifests were signed with")
+    args = parser.parse_args(argv)
+
+    key = None
+    if args.key_file:
+        with open(args.key_file, 'rb') as f:
+            key = f.read().strip()
+    failed = 0
+    for path in args.recordings:
+        try:
+            result = verify_recording(path, key)
+        except Exception as e:
+            print(f"{path}: Error verifying: {str(e)}")
+            failed += 1
+            continue
+        print(f"{path}: {result}")
+        failed += not result.ok
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
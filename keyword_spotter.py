@@ -0,0 +1,174 @@
+import os
+import wave
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+SAMPLE_RATE = 16000
+FRAME_LENGTH = 400  # 25 ms at 16 kHz
+FRAME_STEP = 160  # 10 ms at 16 kHz
+FFT_SIZE = 512
+MEL_BANDS = 26
+CEPSTRA = 13
+
+
+def _mel_filterbank(bands=MEL_BANDS, fft_size=FFT_SIZE, sample_rate=SAMPLE_RATE):
+    """Triangular mel filters as a (bands, fft_size // 2 + 1) matrix"""
+    def hz_to_mel(hz):
+        return 2595.0 * np.log10(1.0 + hz / 700.0)
+
+    def mel_to_hz(mel):
+        return 700.0 * (10.0 ** (mel / 2595.0) - 1.0)
+
+    mel_points = np.linspace(hz_to_mel(0), hz_to_mel(sample_rate / 2), bands + 2)
+    bins = np.floor((fft_size + 1) * mel_to_hz(mel_points) / sample_rate).astype(int)
+    columns = np.arange(fft_size // 2 + 1)
+    left, center, right = bins[:-2, None], bins[1:-1, None], bins[2:, None]
+    rising = (columns - left) / np.maximum(center - left, 1)
+    falling = (right - columns) / np.maximum(right - center, 1)
+    return np.clip(np.minimum(rising, falling), 0.0, None)
+
+
+def _dct_matrix(cepstra=CEPSTRA, bands=MEL_BANDS):
+    """Orthonormal DCT-II basis mapping log mel energies to cepstra"""
+    n = np.arange(bands)
+    k = np.arange(cepstra)[:, None]
+    basis = np.cos(np.pi * k * (2 * n + 1) / (2 * bands)) * np.sqrt(2.0 / bands)
+    basis[0] /= np.sqrt(2.0)
+    return basis
+
+
+_FILTERBANK = _mel_filterbank()
+_DCT = _dct_matrix()
+_WINDOW = np.hamming(FRAME_LENGTH).astype(np.float32)
+
+
+def pcm_to_samples(pcm, sample_rate):
+    """Convert 16-bit mono PCM bytes to float samples at SAMPLE_RATE"""
+    samples = np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+    if sample_rate != SAMPLE_RATE and len(samples):
+        duration = len(samples) / sample_rate
+        target = np.arange(int(duration * SAMPLE_RATE)) / SAMPLE_RATE
+        samples = np.interp(target, np.arange(len(samples)) / sample_rate, samples).astype(np.float32)
+    return samples
+
+
+def mfcc(samples, trim=True):
+    """Compute normalized MFCC frames (frames x CEPSTRA - 1).
+
+    Every step is a whole-array operation: framing is a strided view,
+    and the filterbank and DCT are single matrix products.
+    """
+    if len(samples) < FRAME_LENGTH:
+        return np.empty((0, CEPSTRA - 1), dtype=np.float32)
+
+    emphasized = np.append(samples[0], samples[1:] - 0.97 * samples[:-1])
+    frames = sliding_window_view(emphasized, FRAME_LENGTH)[::FRAME_STEP] * _WINDOW
+    power = np.abs(np.fft.rfft(frames, FFT_SIZE)) ** 2 / FFT_SIZE
+
+    if trim:
+        # Keep the span between the first and last frame within 30 dB of
+        # the loudest one, dropping leading and trailing silence
+        energy = power.sum(axis=1)
+        voiced = np.flatnonzero(energy > energy.max() * 1e-3)
+        if len(voiced):
+            power = power[voiced[0]:voiced[-1] + 1]
+
+    log_mel = np.log(power @ _FILTERBANK.T + 1e-10)
+    # Drop c0 (overall loudness), normalize away the channel and scale
+    # each frame to unit length so frame distances are cosine distances
+    cepstra = (log_mel @ _DCT.T)[:, 1:]
+    cepstra = (cepstra - cepstra.mean(axis=0)) / (cepstra.std(axis=0) + 1e-8)
+    cepstra /= np.linalg.norm(cepstra, axis=1, keepdims=True) + 1e-8
+    return cepstra.astype(np.float32)
+
+
+def subsequence_dtw(template, utterance):
+    """Best alignment cost of `template` anywhere inside `utterance`.
+
+    The utterance may start and end at any frame, so a keyword is found
+    inside a longer phrase. Cells on the same anti-diagonal do not depend
+    on each other, so each diagonal is filled with one vector operation.
+    Returns the cost normalized by the template length.
+    """
+    n, m = len(template), len(utterance)
+    if n == 0 or m == 0:
+        return np.inf
+
+    # Frames are unit vectors, so one matrix product gives every
+    # pairwise cosine distance
+    cost = 1.0 - template @ utterance.T
+
+    acc = np.full((n + 1, m + 1), np.inf, dtype=np.float64)
+    acc[0, :] = 0.0
+    for diagonal in range(2, n + m + 1):
+        i = np.arange(max(1, diagonal - m), min(n, diagonal - 1) + 1)
+        j = diagonal - i
+        acc[i, j] = cost[i - 1, j - 1] + np.minimum(
+            np.minimum(acc[i - 1, j], acc[i, j - 1]), acc[i - 1, j - 1]
+        )
+    return acc[n, 1:].min() / n
+
+
+class KeywordSpotter:
+    """Offline keyword spotting by template matching.
+
+    Enroll a few recordings of each command word, then detect() compares
+    incoming audio against every template with subsequence DTW over MFCC
+    features. Nothing leaves the device.
+    """
+
+    def __init__(self, threshold=0.3):
+        self.threshold = threshold
+        self.templates = []
+
+    def enroll(self, label, pcm, sample_rate=SAMPLE_RATE):
+        """Add a 16-bit mono PCM example of `label`"""
+        features = mfcc(pcm_to_samples(pcm, sample_rate))
+        if len(features) == 0:
+            raise ValueError(f"Enrollment sample for '{label}' is too short")
+        self.templates.append((label, features))
+
+    def enroll_wav(self, label, path):
+        """Add an example of `label` from a 16-bit mono WAV file"""
+        with wave.open(path, 'rb') as wf:
+            if wf.getsampwidth() != 2 or wf.getnchannels() != 1:
+                raise ValueError(f"{path} must be 16-bit mono")
+            self.enroll(label, wf.readframes(wf.getnframes()), wf.getframerate())
+
+    def load_directory(self, directory):
+        """Enroll every <directory>/<label>/*.wav file; returns the count"""
+        count = 0
+        if not os.path.isdir(directory):
+            return count
+        for label in sorted(os.listdir(directory)):
+            label_dir = os.path.join(directory, label)
+            if not os.path.isdir(label_dir):
+                continue
+            for name in sorted(os.listdir(label_dir)):
+                if name.lower().endswith('.wav'):
+                    self.enroll_wav(label, os.path.join(label_dir, name))
+                    count += 1
+        return count
+
+    def labels(self):
+        return sorted({label for label, _ in self.templates})
+
+    def score(self, pcm, sample_rate=SAMPLE_RATE):
+        """Return (label, distance) of the closest template, or (None, inf)"""
+        features = mfcc(pcm_to_samples(pcm, sample_rate))
+        best_label, best_distance = None, np.inf
+        for label, template in self.templates:
+            # A keyword cannot fit into a much shorter utterance
+            if len(features) * 2 < len(template):
+                continue
+            distance = subsequence_dtw(template, features)
+            if distance < best_distance:
+                best_label, best_distance = label, distance
+        return best_label, best_distance
+
+    def detect(self, pcm, sample_rate=SAMPLE_RATE):
+        """Return the label of the matching keyword, or None"""
+        label, distance = self.score(pcm, sample_rate)
+        if label is not None and distance <= self.threshold:
+            return label
+        return None
@@ -1,14 +1,146 @@
 import sys
 import signal
+import asyncio
+import importlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from audio_recorder import AudioRecorder
-from voice_detector import VoiceDetector
+from capture import CapturePipeline
+from encoder import RecordingEncoder
+from metrics import MetricsExporter
+from orchestrator import Orchestrator
 from utils import print_instructions, create_recordings_directory, get_command_keywords
 
+# Seconds of audio from before the start command kept in each recording
+PRE_ROLL_SECONDS = 5.0
+
+# Extra trigger phrases and their actions: "start", "stop", or
+# "alert:<number>" to alert that contact, e.g. {"call mom": "alert:+15551234567"}
+TRIGGER_PHRASES = {}
+
+# Recognize overlapping windows of audio on a worker pool instead of
+# listening for one phrase at a time (sends more audio for recognition)
+CONTINUOUS_RECOGNITION = False
+
+# Split recordings into segments of this many seconds with a manifest,
+# so finished parts are usable while recording continues (None for one file)
+SEGMENT_SECONDS = 60
+
+# Store recordings at this sample rate (None keeps the capture rate)
+RECORDING_RATE = 16000
+
+# Compress finished recordings to FLAC in the background (needs soundfile)
+ENCODE_FLAC = False
+
+# Hash recordings into a tamper-evident chain while they are written and
+# save it as a manifest next to each one (check with integrity.py);
+# INTEGRITY_KEY (bytes) signs the manifests with HMAC-SHA256
+INTEGRITY_MANIFESTS = True
+INTEGRITY_KEY = None
+
+# Upload finished recordings and segments to this endpoint (see
+# uploader.py for the protocol; None keeps recordings on the device only),
+# with UPLOAD_CONCURRENCY uploads at a time and at most
+# UPLOAD_BYTES_PER_SECOND in total
+UPLOAD_URL = None
+UPLOAD_TOKEN = None
+UPLOAD_CONCURRENCY = 1
+UPLOAD_BYTES_PER_SECOND = 256 * 1024
+
+# Export counters and stage latencies to this file every METRICS_INTERVAL
+# seconds, as Prometheus text ("prometheus") or JSON lines ("jsonl");
+# None disables the export
+METRICS_FILE = None
+METRICS_FORMAT = "prometheus"
+METRICS_INTERVAL = 15.0
+
 def signal_handler(sig, frame):
     """Handle Ctrl+C gracefully"""
     print("\nExiting program...")
     sys.exit(0)
 
+def _timed(timings, label, func, *args, **kwargs):
+    """Call func and record how long it took under label"""
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    timings[label] = time.perf_counter() - started
+    return result
+
+def _init_detector(voice_detector, start_command, stop_command, sen_number, capture):
+    print("\nInitializing voice detector...")
+    detector = voice_detector.result().VoiceDetector(
+        start_command=start_command, stop_command=stop_command, sen_number=sen_number, capture=capture,
+        continuous=CONTINUOUS_RECOGNITION, phrases=TRIGGER_PHRASES)
+    print("Voice detector initialized successfully.")
+    return detector
+
+def _init_recorder(capture):
+    print("\nInitializing audio recorder...")
+    encoder = None
+    if ENCODE_FLAC:
+        try:
+            encoder = RecordingEncoder()
+        except ImportError:
+            print("FLAC encoding needs the 'soundfile' package; keeping WAV files only.")
+    uploader = None
+    if UPLOAD_URL:
+        from uploader import RecordingUploader
+        uploader = RecordingUploader(UPLOAD_URL, token=UPLOAD_TOKEN, concurrency=UPLOAD_CONCURRENCY,
+                                     max_bytes_per_second=UPLOAD_BYTES_PER_SECOND)
+        # Resume anything left over from earlier runs; files already on
+        # the server cost one HEAD request
+        uploader.submit_directory()
+    from catalog import RecordingCatalog
+    catalog = RecordingCatalog()
+    # Recordings from before the catalog existed are indexed once, in the background
+    threading.Thread(target=catalog.index_directory, daemon=True).start()
+    recorder = AudioRecorder(pre_roll_seconds=PRE_ROLL_SECONDS, capture=capture, segment_seconds=SEGMENT_SECONDS,
+                             output_rate=RECORDING_RATE, encoder=encoder, catalog=catalog,
+                             integrity=INTEGRITY_MANIFESTS, integrity_key=INTEGRITY_KEY, uploader=uploader)
+    recorder.arm()
+    print("Audio recorder initialized successfully.")
+    return recorder
+
+def init_components(start_command, stop_command, sen_number, voice_detector=None, timings=None):
+    """Open the capture pipeline and set up the detector and recorder.
+
+    voice_detector may be a Future of the already loading module. Returns
+    (capture, detector, recorder) and fills timings with each step's time.
+    """
+    timings = {} if timings is None else timings
+    with ThreadPoolExecutor(max_workers=3, thread_name_prefix="startup") as pool:
+        if voice_detector is None:
+            voice_detector = pool.submit(_timed, timings, "import speech recognition",
+                                         importlib.import_module, "voice_detector")
+
+        # A single capture pipeline owns the microphone and feeds both the
+        # voice detector and the recorder
+        print("\nInitializing audio capture...")
+        capture = _timed(timings, "audio capture", CapturePipeline)
+        # Open the input stream here, before the detector and recorder
+        # would both try to start it from their own threads
+        try:
+            _timed(timings, "open input stream", capture.start)
+        except Exception as e:
+            # Carry on; the detector falls back to simulation mode and the
+            # recorder reports that it could not arm
+            print(f"\nWarning: Could not open the audio input stream: {str(e)}")
+
+        # The detector and the recorder only share the capture pipeline,
+        # so they are set up side by side
+        detector = pool.submit(_timed, timings, "voice detector", _init_detector,
+                               voice_detector, start_command, stop_command, sen_number, capture)
+        recorder = pool.submit(_timed, timings, "audio recorder", _init_recorder, capture)
+        return capture, detector.result(), recorder.result()
+
+def print_startup_times(timings, time_to_armed):
+    """Print how long each part of startup took"""
+    print("\n=== Startup time ===")
+    for label, seconds in timings.items():
+        print(f"- {label}: {seconds * 1000:.0f} ms")
+    print(f"Listening {time_to_armed * 1000:.0f} ms after setup")
+
 def main():
     # Set up signal handler for Ctrl+C
     signal.signal(signal.SIGINT, signal_handler)
@@ -16,53 +148,58 @@ def main():
     # Create recordings directory
     create_recordings_directory()
 
+    if METRICS_FILE:
+        MetricsExporter(METRICS_FILE, format=METRICS_FORMAT, interval=METRICS_INTERVAL).start()
+
+    recorder = None
     try:
+        timings = {}
+        loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="startup")
+        # Load the speech recognition stack while the user answers the
+        # setup questions; Twilio is only imported when the first alert is sent
+        voice_detector = loader.submit(_timed, timings, "import speech recognition",
+                                       importlib.import_module, "voice_detector")
+
         # Get custom command keywords from user
         start_command, stop_command, sen_number = get_command_keywords()
+        setup_done = time.perf_counter()
 
         # Initialize components
-        print("\nInitializing voice detector...")
-        detector = VoiceDetector(start_command=start_command, stop_command=stop_command, sen_number=sen_number)
-        print("Voice detector initialized successfully.")
-
-        print("\nInitializing audio recorder...")
-        recorder = AudioRecorder()
-        print("Audio recorder initialized successfully.")
+        capture, detector, recorder = init_components(start_command, stop_command, sen_number,
+                                                      voice_detector, timings)
+        loader.shutdown()
+        print_startup_times(timings, time.perf_counter() - setup_done)
 
         # Print instructions with custom commands
         print_instructions(start_command, stop_command, sen_number)
 
-        # Main application loop
-        recording_in_progress = False
-
-        while True:
-            try:
-                # Listen for commands
-                command = detector.listen_for_command()
-
-                if command == "start" and not recording_in_progress:
-                    # Start recording
-                    if recorder.start_recording():
-                        recording_in_progress = True
-                        print(f"\nRecording started! Say '{stop_command}' to end recording.")
-                elif command == "stop" and recording_in_progress:
-                    # Stop recording
-                    filename = recorder.stop_recording()
-                    if filename:
-                        recording_in_progress = False
-                        print(f"\nReady for next command... (Say '{start_command}' to start a new recording)")
-
-            except Exception as e:
-                print(f"\nAn error occurred: {str(e)}")
-                if recording_in_progress:
-                    recorder.stop_recording()
-                    recording_in_progress = False
-                print("\nRestarting voice detection...")
+        run(detector, recorder, start_command, stop_command)
 
     except Exception as e:
         print(f"\nFatal error: {str(e)}")
         print("Please ensure you have a working microphone connected and try again.")
         sys.exit(1)
+    finally:
+        if recorder is not None:
+            stop_uploads(recorder)
+
+def stop_uploads(recorder):
+    """Stop background uploads without waiting for the queue, so exiting
+    never hangs on them; unfinished files resume on the next run"""
+    if recorder.uploader is not None:
+        recorder.uploader.shutdown(wait=False)
+
+def run(detector, recorder, start_command, stop_command, stop_event=None, on_event=None):
+    """Main application loop; runs until stop_event (if given) is set.
+
+    Detection, recording, alerting and saving are driven by an
+    Orchestrator state machine on an asyncio loop, so saving a recording
+    or sending an alert never delays hearing the next command.
+    on_event(event, detail) is told about "recording_started",
+    "recording_stopped" (with the filename), "error" (with the message)
+    and the other Orchestrator events.
+    """
+    asyncio.run(Orchestrator(detector, recorder, start_command, stop_command, on_event).run(stop_event))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,44 +1,111 @@
 import os
-from twilio.rest import Client
-from twilio.base.exceptions import TwilioRestException
+import heapq
+import itertools
+import queue
+import socket
+import sqlite3
+import threading
+import time
+from metrics import default_registry
+
+_SEND_LATENCY = default_registry.histogram(
+    "stealthrec_stage_seconds", "Time spent in each stage of the pipeline", stage="alert_send")
+_DELIVERY_LATENCY = default_registry.histogram(
+    "stealthrec_alert_delivery_seconds", "Time from queueing an alert to its delivery",
+    buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 1800.0, 3600.0))
+
+class TwilioTransport:
+    """
+    Send SMS through a single long-lived Twilio client.
+    The client (and its HTTP session) is created on first use and reused,
+    so later messages skip client setup and reuse the open connection.
+    The Twilio SDK is only imported then too, keeping it off startup.
+    """
+
+    def __init__(self, account_sid='account_sid', auth_token='auth_token', from_number='from_number'):
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self.from_number = from_number
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                from twilio.rest import Client
+                self._client = Client(self.account_sid, self.auth_token)
+            return self._client
+
+    def missing_credentials(self, to_number):
+        """Return the names of required settings that are empty"""
+        return [var for var, val in {
+            "TWILIO_ACCOUNT_SID": self.account_sid,
+            "TWILIO_AUTH_TOKEN": self.auth_token,
+            "TWILIO_PHONE_NUMBER": self.from_number,
+            "EMERGENCY_CONTACT_NUMBER": to_number
+        }.items() if not val]
+
+    def is_reachable(self, timeout=3.0) -> bool:
+        """Check whether the Twilio API can be reached at all"""
+        try:
+            socket.create_connection(("api.twilio.com", 443), timeout=timeout).close()
+            return True
+        except OSError:
+            return False
+
+    def send(self, to_number: str, message: str) -> str:
+        """Send one SMS and return its SID; raises on failure"""
+        missing_vars = self.missing_credentials(to_number)
+        if missing_vars:
+            raise ValueError(f"Missing required environment variables: {', '.join(missing_vars)}")
+        msg_response = self.client.messages.create(
+            body=message,
+            from_=self.from_number,
+            to=to_number
+        )
+        return msg_response.sid
+
+class MemoryTransport:
+    """Alert transport that records messages instead of sending them
+    (for simulations and benchmarks)"""
+
+    def __init__(self, sid_prefix="SIM"):
+        self.sid_prefix = sid_prefix
+        self.sent = []
+
+    def send(self, to_number, message):
+        self.sent.append((to_number, message))
+        return f"{self.sid_prefix}{len(self.sent)}"
+
+_default_transport = TwilioTransport()
 
 def send_alert_message(to_number: str, message: str) -> bool:
     """
     Send an SMS alert using Twilio.
     Returns True if message was sent successfully, False otherwise.
     """
-    
+
     try:
-        # Get credentials from environment variables
-        account_sid = 'account_sid'
-        auth_token = 'auth_token'
-        from_number = 'from_number'
+        from twilio.base.exceptions import TwilioRestException
+        transport = _default_transport
         # Validate all required credentials are present
-        if not all([account_sid, auth_token, from_number, to_number]):
-            missing_vars = [var for var, val in {
-                "TWILIO_ACCOUNT_SID": account_sid,
-                "TWILIO_AUTH_TOKEN": auth_token,
-                "TWILIO_PHONE_NUMBER": from_number,
-                "EMERGENCY_CONTACT_NUMBER": to_number
-            }.items() if not val]
+        missing_vars = transport.missing_credentials(to_number)
+        if missing_vars:
             print(f"\nError: Missing required environment variables: {', '.join(missing_vars)}")
             return False
 
-        # Initialize Twilio client
+        # Initialize Twilio client (created once and reused)
         try:
-            client = Client(account_sid, auth_token)
+            transport.client
         except Exception as e:
             print(f"\nError initializing Twilio client: {str(e)}")
             return False
 
         # Send message
         try:
-            msg_response = client.messages.create(
-                body=message,
-                from_=from_number,
-                to=to_number
-            )
-            print(f"\nAlert message sent successfully (SID: {msg_response.sid})")
+            sid = transport.send(to_number, message)
+            print(f"\nAlert message sent successfully (SID: {sid})")
             return True
         except TwilioRestException as e:
             print(f"\nTwilio API Error: {str(e)}")
@@ -49,3 +116,293 @@ def send_alert_message(to_number: str, message: str) -> bool:
     except Exception as e:
         print(f"\nUnexpected error sending alert message: {str(e)}")
         return False
+
+# Queued by AlertDispatcher.stop() to end the delivery thread
+_STOP = object()
+
+class Alert:
+    """An alert message and its delivery state"""
+
+    def __init__(self, to_number, message):
+        self.id = None  # Row id once recorded in an AlertOutbox
+        self.to_number = to_number
+        self.message = message
+        self.status = "queued"
+        self.attempts = 0
+        self.sid = None
+        self.error = None
+        self.created_at = time.time()
+
+    def __repr__(self):
+        return f"Alert(to={self.to_number!r}, status={self.status!r}, attempts={self.attempts})"
+
+class AlertOutbox:
+    """
+    Crash-safe record of every alert, kept in SQLite.
+    Alerts are inserted before the first send attempt, so an alert that
+    was never delivered (no network, process killed) is still pending on
+    the next start. The database runs in WAL mode with synchronous=NORMAL:
+    a commit is an append to the log with no fsync, which keeps add() cheap
+    enough for the command detection path. Status updates are buffered and
+    written in one transaction per batch.
+    Delivery is at-least-once: an alert sent just before a crash may be
+    sent again after it.
+    """
+
+    PENDING = ("queued", "retrying", "deferred")
+
+    def __init__(self, path="alerts.db", batch_size=32):
+        self.path = path
+        self.batch_size = batch_size
+        self._updates = []
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS alerts (
+                id INTEGER PRIMARY KEY,
+                to_number TEXT NOT NULL,
+                message TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                sid TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS alerts_status ON alerts (status, id)")
+        self._db.commit()
+
+    def add(self, alert):
+        """Record a new alert before it is sent"""
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO alerts (to_number, message, status, attempts, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (alert.to_number, alert.message, alert.status, alert.attempts, alert.created_at, time.time())
+            )
+            self._db.commit()
+            alert.id = cursor.lastrowid
+        return alert
+
+    def update(self, alert):
+        """Buffer a status change; written on flush() or once a batch is full"""
+        error = str(alert.error) if alert.error else None
+        with self._lock:
+            self._updates.append((alert.status, alert.attempts, alert.sid, error, time.time(), alert.id))
+            if len(self._updates) < self.batch_size:
+                return
+        self.flush()
+
+    def flush(self):
+        """Write all buffered status changes in a single transaction"""
+        with self._lock:
+            if not self._updates:
+                return
+            updates, self._updates = self._updates, []
+            self._db.executemany(
+                "UPDATE alerts SET status = ?, attempts = ?, sid = ?, error = ?, updated_at = ? WHERE id = ?",
+                updates
+            )
+            self._db.commit()
+
+    def pending(self, limit=50, exclude=()):
+        """Return up to `limit` undelivered alerts, oldest first"""
+        self.flush()
+        exclude = list(exclude)
+        query = ("SELECT id, to_number, message, status, attempts, created_at FROM alerts "
+                 f"WHERE status IN ({', '.join('?' * len(self.PENDING))})")
+        if exclude:
+            query += f" AND id NOT IN ({', '.join('?' * len(exclude))})"
+        with self._lock:
+            rows = self._db.execute(query + " ORDER BY id LIMIT ?", (*self.PENDING, *exclude, limit)).fetchall()
+        alerts = []
+        for row_id, to_number, message, status, attempts, created_at in rows:
+            alert = Alert(to_number, message)
+            alert.id, alert.status, alert.attempts, alert.created_at = row_id, status, attempts, created_at
+            alerts.append(alert)
+        return alerts
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._db.close()
+
+class AlertDispatcher:
+    """
+    Deliver alerts from a background thread.
+    submit() only queues the alert and returns, so callers (like the voice
+    detector starting a recording) never wait on the SMS API. Failed sends
+    are retried with exponential backoff, and every status change
+    ("queued", "sent", "retrying", "deferred", "failed") is reported to
+    the status callbacks as on_status(alert).
+    With an AlertOutbox, alerts that run out of attempts on a transient
+    error are parked as "deferred" instead of failing, and pending alerts
+    are replayed in batches whenever the transport is reachable again,
+    including ones left over from a previous run.
+    The transport is any object with send(to_number, message) -> sid (and
+    optionally is_reachable() -> bool), so a local stub can stand in for
+    Twilio.
+    """
+
+    def __init__(self, transport=None, max_attempts=5, backoff=1.0, max_backoff=60.0, on_status=None,
+                 outbox=None, replay_interval=30.0, replay_batch=20):
+        self.transport = transport if transport is not None else _default_transport
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.outbox = outbox
+        self.replay_interval = replay_interval
+        self.replay_batch = replay_batch
+        self._callbacks = [on_status] if on_status else []
+        self._queue = queue.Queue()
+        # Alerts waiting for a retry, as (due time, sequence, alert)
+        self._retries = []
+        self._sequence = itertools.count()
+        # Outbox ids currently queued or waiting for a retry; submit() and
+        # _replay() hold the lock so a new alert is never replayed as well
+        self._in_flight = set()
+        self._in_flight_lock = threading.Lock()
+        self._next_replay = 0.0
+        self._thread = None
+        self._running = False
+
+    def add_status_callback(self, callback):
+        self._callbacks.append(callback)
+
+    def remove_status_callback(self, callback):
+        # Replace the list so a delivery thread iterating it is unaffected
+        self._callbacks = [existing for existing in self._callbacks if existing != callback]
+
+    def start(self):
+        """Start the delivery thread (called automatically by submit); with
+        an outbox, start it early so leftover alerts are replayed"""
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, to_number, message):
+        """Queue an alert for delivery and return it immediately"""
+        self.start()
+        alert = Alert(to_number, message)
+        if self.outbox is not None:
+            with self._in_flight_lock:
+                self.outbox.add(alert)
+                self._in_flight.add(alert.id)
+        self._notify(alert)
+        self._queue.put(alert)
+        return alert
+
+    def stop(self, timeout=5.0):
+        """Deliver what is already queued, then stop the thread"""
+        if not self._running:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout=timeout)
+        self._running = False
+        if self.outbox is not None:
+            self.outbox.flush()
+
+    def _notify(self, alert):
+        default_registry.counter("stealthrec_alerts_total", "Alert status changes", status=alert.status).inc()
+        for callback in self._callbacks:
+            try:
+                callback(alert)
+            except Exception as e:
+                print(f"\nWarning: Alert status callback failed: {str(e)}")
+
+    def _next_alert(self):
+        """Return the next alert to send, or None when a wait timed out"""
+        if self._retries and self._retries[0][0] <= time.monotonic():
+            return heapq.heappop(self._retries)[2]
+        deadlines = [self._retries[0][0]] if self._retries else []
+        if self.outbox is not None:
+            deadlines.append(self._next_replay)
+        timeout = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _run(self):
+        while True:
+            if self.outbox is not None and time.monotonic() >= self._next_replay:
+                self._replay()
+            alert = self._next_alert()
+            if alert is _STOP:
+                break
+            if alert is not None:
+                self._deliver(alert)
+            # Group commit: write status changes once a burst is over
+            if self.outbox is not None and self._queue.empty():
+                self.outbox.flush()
+
+        # Give alerts still waiting for a retry one last attempt
+        while self._retries:
+            alert = heapq.heappop(self._retries)[2]
+            alert.attempts = max(alert.attempts, self.max_attempts - 1)
+            self._deliver(alert)
+
+    def _replay(self):
+        """Schedule a batch of undelivered outbox alerts if the transport is up"""
+        self._next_replay = time.monotonic() + self.replay_interval
+        is_reachable = getattr(self.transport, 'is_reachable', None)
+        try:
+            with self._in_flight_lock:
+                pending = self.outbox.pending(limit=self.replay_batch, exclude=self._in_flight)
+            # Only probe the network when there is something to send
+            if not pending or (is_reachable is not None and not is_reachable()):
+                return
+        except Exception as e:
+            print(f"\nWarning: Could not replay pending alerts: {str(e)}")
+            return
+        now = time.monotonic()
+        with self._in_flight_lock:
+            self._in_flight.update(alert.id for alert in pending)
+        for alert in pending:
+            # Replayed alerts get a fresh set of attempts
+            alert.attempts = 0
+            heapq.heappush(self._retries, (now, next(self._sequence), alert))
+        if len(pending) == self.replay_batch:
+            # More may be waiting; fetch the next batch right away
+            self._next_replay = now
+
+    def _deliver(self, alert):
+        alert.attempts += 1
+        try:
+            with _SEND_LATENCY.time():
+                alert.sid = self.transport.send(alert.to_number, alert.message)
+            alert.status = "sent"
+            alert.error = None
+            _DELIVERY_LATENCY.observe(time.time() - alert.created_at)
+        except Exception as e:
+            alert.error = e
+            if not self._is_retryable(e):
+                alert.status = "failed"
+            elif alert.attempts >= self.max_attempts:
+                # With an outbox the alert waits for the next replay
+                alert.status = "deferred" if self.outbox is not None else "failed"
+            else:
+                alert.status = "retrying"
+                delay = min(self.backoff * 2 ** (alert.attempts - 1), self.max_backoff)
+                heapq.heappush(self._retries, (time.monotonic() + delay, next(self._sequence), alert))
+        if alert.status != "retrying":
+            with self._in_flight_lock:
+                self._in_flight.discard(alert.id)
+        if self.outbox is not None and alert.id is not None:
+            self.outbox.update(alert)
+        self._notify(alert)
+
+    @staticmethod
+    def _is_retryable(error):
+        """Client errors (bad number, bad credentials) will not fix themselves"""
+        if isinstance(error, ValueError):
+            return False
+        status = getattr(error, 'status', None)
+        if isinstance(status, int) and 400 <= status < 500 and status != 429:
+            return False
+        return True
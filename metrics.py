@@ -0,0 +1,209 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# Latency buckets in seconds, from a fast chunk read to a slow network call
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Counter:
+    """Monotonic count (chunks, bytes, overflows, ...)"""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def sample(self):
+        return self.value
+
+
+class Histogram:
+    """Distribution of observed values, usually stage latencies in seconds"""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # counts[i] is the number of observations <= buckets[i]; the last
+        # slot holds those above every bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        """Context manager observing the duration of its block"""
+        return _Timer(self)
+
+    def sample(self):
+        with self._lock:
+            counts = list(self.counts)
+            total, count = self.sum, self.count
+        cumulative, running = [], 0
+        for bound, n in zip(self.buckets, counts):
+            running += n
+            cumulative.append((bound, running))
+        return {"buckets": cumulative, "sum": total, "count": count}
+
+
+class _Timer:
+    __slots__ = ("histogram", "started")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.histogram.observe(time.perf_counter() - self.started)
+
+
+class MetricsRegistry:
+    """Named counters and histograms shared by the whole application.
+
+    Metrics are created once (usually at import time) and updated in
+    place, so the hot path only pays for a lock and an addition. A
+    metric is identified by its name plus keyword labels, e.g.
+    ``registry.histogram("stealthrec_stage_seconds", "...", stage="listen")``.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help, labels, **kwargs):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            metric = self._metrics.get(key)
+            if metric is None:
+                metric = self._metrics[key] = cls(name, help, dict(key[1]), **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name, help, **labels):
+        return self._get(Counter, name, help, labels)
+
+    def histogram(self, name, help, buckets=DEFAULT_BUCKETS, **labels):
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    def metrics(self):
+        with self._lock:
+            return list(self._metrics.values())
+
+    def snapshot(self):
+        """Current values as a JSON-friendly dict"""
+        result = {"timestamp": time.time(), "metrics": []}
+        for metric in self.metrics():
+            result["metrics"].append({
+                "name": metric.name,
+                "type": metric.kind,
+                "labels": metric.labels,
+                "value": metric.sample()
+            })
+        return result
+
+    def to_prometheus(self):
+        """Current values in the Prometheus text exposition format"""
+        lines, described = [], set()
+        for metric in sorted(self.metrics(), key=lambda m: m.name):
+            if metric.name not in described:
+                described.add(metric.name)
+                lines.append(f"# HELP {metric.name} {metric.help}")
+                lines.append(f"# TYPE {metric.name} {metric.kind}")
+            if metric.kind == "counter":
+                lines.append(f"{metric.name}{_labels(metric.labels)} {metric.sample()}")
+                continue
+            sample = metric.sample()
+            for bound, count in sample["buckets"]:
+                lines.append(f"{metric.name}_bucket{_labels(metric.labels, le=repr(float(bound)))} {count}")
+            lines.append(f"{metric.name}_bucket{_labels(metric.labels, le='+Inf')} {sample['count']}")
+            lines.append(f"{metric.name}_sum{_labels(metric.labels)} {sample['sum']}")
+            lines.append(f"{metric.name}_count{_labels(metric.labels)} {sample['count']}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels, **extra):
+    items = list(labels.items()) + list(extra.items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in items) + "}"
+
+
+class MetricsExporter:
+    """Write the registry to a file periodically from a background thread.
+
+    "prometheus" rewrites a text file atomically each interval (suitable
+    for the node_exporter textfile collector); "jsonl" appends one JSON
+    snapshot per line. Nothing is exported on the hot path.
+    """
+
+    def __init__(self, path, format="prometheus", interval=15.0, registry=None):
+        if format not in ("prometheus", "jsonl"):
+            raise ValueError(f"Unknown metrics format: {format}")
+        self.path = path
+        self.format = format
+        self.interval = interval
+        self.registry = registry if registry is not None else default_registry
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the thread after writing a final export"""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join(timeout=5.0)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.export()
+        self.export()
+
+    def export(self):
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            if self.format == "jsonl":
+                with open(self.path, 'a') as f:
+                    f.write(json.dumps(self.registry.snapshot()) + "\n")
+            else:
+                temp = self.path + ".tmp"
+                with open(temp, 'w', newline='\n') as f:
+                    f.write(self.registry.to_prometheus())
+                os.replace(temp, self.path)
+        except OSError as e:
+            print(f"\nError exporting metrics: {str(e)}")
+
+
+# Registry used by the capture, recorder, detector and messaging modules
+default_registry = MetricsRegistry()
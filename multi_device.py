@@ -0,0 +1,227 @@
+"""
+Record from several input devices at once into one session directory.
+
+Multi-device recording runs on its own rather than from main.py: the
+voice-triggered loop listens on the default device, while this records
+the chosen devices side by side. Use it from the command line:
+
+    python multi_device.py --list
+    python multi_device.py 1 3 [--seconds 60] [--directory recordings] [--segment-seconds 60]
+
+which records until --seconds have passed or Enter is pressed, or drive
+MultiDeviceRecorder from code with start_recording()/stop_recording()
+(the same calls as AudioRecorder) and close() when done.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import pyaudio
+from audio_recorder import AudioRecorder
+from capture import CapturePipeline
+
+
+def input_devices(audio=None):
+    """Return a dict (index, name, channels, sample_rate) for every input device"""
+    owns_audio = audio is None
+    audio = audio if audio is not None else pyaudio.PyAudio()
+    try:
+        devices = []
+        for index in range(audio.get_device_count()):
+            info = audio.get_device_info_by_index(index)
+            if info.get('maxInputChannels', 0) > 0:
+                devices.append({"index": index, "name": info.get('name'), "channels": info['maxInputChannels'],
+                                "sample_rate": int(info.get('defaultSampleRate', 44100))})
+        return devices
+    finally:
+        if owns_audio:
+            audio.terminate()
+
+
+def fit_clock(anchors, nominal_rate):
+    """Fit time = start + frame / rate to (frame, time) anchors.
+
+    Returns (start, rate): the monotonic time of frame 0 and the rate the
+    device actually delivered. With fewer than two anchors the nominal
+    rate is assumed.
+    """
+    if not anchors:
+        return None, nominal_rate
+    if len(anchors) < 2 or anchors[-1][0] == anchors[0][0]:
+        frame, at = anchors[-1]
+        return at - frame / nominal_rate, nominal_rate
+    count = len(anchors)
+    mean_frame = sum(frame for frame, _ in anchors) / count
+    mean_time = sum(at for _, at in anchors) / count
+    covariance = sum((frame - mean_frame) * (at - mean_time) for frame, at in anchors)
+    variance = sum((frame - mean_frame) ** 2 for frame, _ in anchors)
+    seconds_per_frame = covariance / variance
+    return mean_time - mean_frame * seconds_per_frame, 1.0 / seconds_per_frame
+
+
+class MultiDeviceRecorder:
+    """
+    Record from several input devices at once.
+    Each device gets its own CapturePipeline and AudioRecorder, so
+    capture, recording and file writing run on separate threads per
+    device and nothing is serialized across devices. Each recording
+    session is saved as a directory holding one file per device and a
+    session.json with what is needed to line the files up: the capture
+    stream frame each file starts at, (frame, monotonic time) anchors
+    sampled during the recording, and from those each device's start
+    time, offset from the first device and measured sample rate.
+    Devices are given as indexes or as dicts with "index" and optionally
+    "channels" and "sample_rate" (see input_devices()).
+    """
+
+    def __init__(self, devices, directory="recordings", sample_rate=44100, chunk_size=1024, channels=1,
+                 audio=None, segment_seconds=None):
+        self.directory = directory
+        self.audio = audio if audio is not None else pyaudio.PyAudio()
+        self.session_directory = None
+        self.started_at = None
+        self.captures = []
+        self.recorders = []
+        for device in devices:
+            if not isinstance(device, dict):
+                device = {"index": device}
+            index = device["index"]
+            capture = CapturePipeline(sample_rate=device.get("sample_rate", sample_rate), chunk_size=chunk_size,
+                                      channels=device.get("channels", channels), audio=self.audio,
+                                      device_index=index)
+            if capture.is_simulation_mode:
+                raise OSError(f"input device {index} is not available")
+            self.captures.append(capture)
+            self.recorders.append(AudioRecorder(pre_roll_seconds=0, capture=capture, segment_seconds=segment_seconds,
+                                                name=f"device{index}"))
+        self._pool = ThreadPoolExecutor(max_workers=max(1, len(self.recorders)), thread_name_prefix="device")
+        self._lock = threading.Lock()
+
+    @property
+    def is_recording(self):
+        return any(recorder.is_recording for recorder in self.recorders)
+
+    def start_recording(self, trigger=None):
+        """Start every device in parallel; returns True if all started"""
+        with self._lock:
+            if self.is_recording:
+                print("\nAlready recording...")
+                return False
+            self.started_at = time.time()
+            timestamp = datetime.fromtimestamp(self.started_at).strftime("%Y%m%d_%H%M%S")
+            self.session_directory = os.path.join(self.directory, f"session_{timestamp}")
+            os.makedirs(self.session_directory, exist_ok=True)
+            for recorder in self.recorders:
+                recorder.directory = self.session_directory
+            started = list(self._pool.map(lambda recorder: recorder.start_recording(trigger), self.recorders))
+            if not all(started):
+                print("\nError starting recording: not every device could be opened")
+                self._stop_all()
+                return False
+            return True
+
+    def stop_recording(self):
+        """Stop every device and write session.json; returns its path"""
+        with self._lock:
+            if not self.is_recording:
+                print("\nNo active recording to stop.")
+                return None
+            # Note where each recording ends before any of them stops
+            end_frames = [capture.frames_published for capture in self.captures]
+            files = self._stop_all()
+            return self._write_session(files, end_frames)
+
+    def _stop_all(self):
+        files = list(self._pool.map(lambda recorder: recorder.stop_recording() if recorder.is_recording else None,
+                                    self.recorders))
+        for capture in self.captures:
+            capture.stop()
+        return files
+
+    def _write_session(self, files, end_frames):
+        devices = []
+        for capture, recorder, path, end_frame in zip(self.captures, self.recorders, files, end_frames):
+            start_frame = recorder.recording_start_frame
+            anchors = [(frame, at) for frame, at in capture.clock_anchors
+                       if start_frame is not None and start_frame <= frame <= end_frame]
+            stream_start, rate = fit_clock(anchors, capture.sample_rate)
+            start_time = (stream_start + start_frame / rate
+                          if stream_start is not None and start_frame is not None else None)
+            devices.append({
+                "index": capture.device_index,
+                "name": capture.device_name,
+                "file": os.path.relpath(path, self.session_directory) if path else None,
+                "sample_rate": capture.sample_rate,
+                "channels": capture.channels,
+                "start_frame": start_frame,
+                "start_time": start_time,
+                "measured_rate": rate,
+                # Frames counted from the start of this device's file
+                "anchors": [[frame - start_frame, at] for frame, at in anchors],
+            })
+
+        reference = next((device["start_time"] for device in devices if device["start_time"] is not None), None)
+        for device in devices:
+            device["offset"] = (device["start_time"] - reference
+                                if device["start_time"] is not None and reference is not None else None)
+        session = {"started_at": self.started_at, "clock": "monotonic", "devices": devices}
+        path = os.path.join(self.session_directory, "session.json")
+        with open(path, 'w') as f:
+            json.dump(session, f, indent=2)
+        print(f"\nMulti-device recording saved as: {self.session_directory}")
+        return path
+
+    def close(self):
+        """Stop any recording and release the devices"""
+        if self.is_recording:
+            self.stop_recording()
+        self._pool.shutdown()
+        for capture in self.captures:
+            capture.stop()
+        self.audio.terminate()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record from several input devices at once")
+    parser.add_argument("devices", nargs="*", type=int, help="Input device indexes (see --list)")
+    parser.add_argument("--list", action="store_true", help="List the input devices and exit")
+    parser.add_argument("--seconds", type=float, default=None, help="Stop after this many seconds")
+    parser.add_argument("--directory", default="recordings", help="Where to save the session")
+    parser.add_argument("--segment-seconds", type=float, default=None, help="Split recordings into segments")
+    args = parser.parse_args(argv)
+
+    if args.list or not args.devices:
+        for device in input_devices():
+            print(f"{device['index']}: {device['name']} ({device['channels']} ch, {device['sample_rate']} Hz)")
+        return 0 if args.list else 1
+
+    os.makedirs(args.directory, exist_ok=True)
+    try:
+        # Each device records at its own default rate
+        rates = {device["index"]: device["sample_rate"] for device in input_devices()}
+        recorder = MultiDeviceRecorder([{"index": index, "sample_rate": rates.get(index, 44100)}
+                                        for index in args.devices],
+                                       directory=args.directory, segment_seconds=args.segment_seconds)
+    except Exception as e:
+        print(f"\nError opening input devices: {str(e)}")
+        return 1
+    try:
+        if not recorder.start_recording("cli"):
+            return 1
+        if args.seconds is not None:
+            time.sleep(args.seconds)
+        else:
+            input("\nRecording... press Enter to stop.\n")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        recorder.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
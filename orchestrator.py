@@ -0,0 +1,285 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Recorder states; alerts run alongside them (see Orchestrator.alerting)
+ARMED = "armed"
+RECORDING = "recording"
+SAVING = "saving"
+
+
+class Orchestrator:
+    """
+    Event-driven controller for detection, recording, alerting and saving.
+    Listening runs on its own thread and posts detected commands as
+    events; the state machine (armed -> recording -> saving -> armed)
+    reacts to them on an asyncio loop, while starting and saving
+    recordings run on a recorder thread and alerts are delivered by the
+    AlertDispatcher, whose progress arrives as events too. A slow save
+    or alert therefore never holds up listening for the next command. A
+    start heard while the previous recording is still being saved is
+    carried out as soon as the save finishes.
+    on_event(event, detail) is told about "state" (the new state),
+    "recording_started", "recording_stopped" (the filename), "alerting",
+    "alert_sent", "alert_failed", "alert_deferred" and "error". Other
+    threads (e.g. a UI) can post "start", "stop" or "shutdown" with post().
+    A recording cut short by a capture error is stopped and saved like
+    any other.
+    """
+
+    def __init__(self, detector, recorder, start_command, stop_command, on_event=None, poll_interval=0.1):
+        self.detector = detector
+        self.recorder = recorder
+        self.start_command = start_command
+        self.stop_command = stop_command
+        self.on_event = on_event
+        self.poll_interval = poll_interval
+        self.state = RECORDING if recorder.is_recording else ARMED
+        self._alerts = set()
+        self._loop = None
+        self._events = None
+        self._pending_start = None
+        self._save_task = None
+        self._stopping = False
+        # Recorder calls block, so they run on a thread of their own (each
+        # listen gets a daemon thread, see _listen_once)
+        self._worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="recorder")
+        # Events posted before run() has started its loop
+        self._posted = []
+        self._post_lock = threading.Lock()
+
+    @property
+    def alerting(self):
+        """Whether any alert is still on its way"""
+        return bool(self._alerts)
+
+    def post(self, event, detail=None):
+        """Queue an event from any thread: "start", "stop" or "shutdown".
+        Events posted before run() are handled as soon as it starts."""
+        with self._post_lock:
+            if self._loop is None:
+                self._posted.append((event, detail, None))
+                return
+            self._loop.call_soon_threadsafe(self._events.put_nowait, (event, detail, None))
+
+    def _publish(self, event, detail=None):
+        if self.on_event:
+            try:
+                self.on_event(event, detail)
+            except Exception as e:
+                print(f"\nWarning: Event callback failed: {str(e)}")
+
+    def _set_state(self, state):
+        if state != self.state:
+            self.state = state
+            self._publish("state", state)
+
+    async def run(self, stop_event=None):
+        """Run until stop_event (a threading.Event, if given) is set or a
+        "shutdown" event is posted, then save any recording in progress"""
+        with self._post_lock:
+            self._loop = asyncio.get_running_loop()
+            self._events = asyncio.Queue()
+            for posted in self._posted:
+                self._events.put_nowait(posted)
+            self._posted = []
+        self.detector.dispatcher.add_status_callback(self._on_alert_status)
+        self.recorder.on_capture_error = self._on_capture_error
+        listening = asyncio.create_task(self._listen(stop_event))
+        watcher = asyncio.create_task(self._watch(stop_event)) if stop_event is not None else None
+        try:
+            await self._dispatch()
+        finally:
+            self._stopping = True
+            if watcher is not None:
+                watcher.cancel()
+            if self.state == RECORDING:
+                await self._stop("shutdown")
+            if self._save_task is not None:
+                await self._save_task
+            self._release_waiting()
+            # A listen still in progress is abandoned; its daemon thread
+            # ends with the process
+            listening.cancel()
+            try:
+                await listening
+            except asyncio.CancelledError:
+                pass
+            self.detector.dispatcher.remove_status_callback(self._on_alert_status)
+            self.recorder.on_capture_error = None
+            self._worker.shutdown(wait=True)
+            with self._post_lock:
+                self._loop = None
+
+    async def _watch(self, stop_event):
+        while not stop_event.is_set():
+            await asyncio.sleep(self.poll_interval)
+        self._events.put_nowait(("shutdown", None, None))
+
+    async def _listen(self, stop_event):
+        """Listen for commands and hand each to the state machine"""
+        while not self._stopping and (stop_event is None or not stop_event.is_set()):
+            try:
+                command = await self._listen_once()
+            except Exception as e:
+                print(f"\nError in voice detection: {str(e)}")
+                self._publish("error", str(e))
+                continue
+            if command not in ("start", "stop") or self._stopping:
+                continue
+            # Wait until the recorder has acted on the command (a stop
+            # only until capture ends, not for the save) before listening
+            # again, so commands are applied in the order they were heard
+            handled = self._loop.create_future()
+            self._events.put_nowait((command, "voice", handled))
+            await handled
+
+    def _listen_once(self):
+        """Run one listen on a daemon thread and return a future of the
+        command; a listen blocked in input() or recognition must never
+        keep the process from exiting"""
+        loop = self._loop
+        result = loop.create_future()
+
+        def settle(command, error):
+            if result.done():
+                return
+            if error is not None:
+                result.set_exception(error)
+            else:
+                result.set_result(command)
+
+        def listen():
+            command, error = None, None
+            try:
+                command = self.detector.listen_for_command()
+            except Exception as e:
+                error = e
+            try:
+                loop.call_soon_threadsafe(settle, command, error)
+            except RuntimeError:
+                # The loop has already closed
+                pass
+
+        threading.Thread(target=listen, name="listener", daemon=True).start()
+        return result
+
+    async def _dispatch(self):
+        while True:
+            event, detail, handled = await self._events.get()
+            if event == "shutdown":
+                self._resolve(handled)
+                return
+            try:
+                if self.state == RECORDING and not self.recorder.is_recording:
+                    # Stopped outside the state machine
+                    self._set_state(ARMED)
+                    self._publish("recording_stopped", None)
+                if event == "start":
+                    await self._start(detail, handled)
+                elif event == "stop":
+                    await self._stop(detail)
+                elif event == "saved":
+                    await self._saved(detail)
+                elif event == "alert":
+                    self._alert_changed(detail)
+            except Exception as e:
+                print(f"\nAn error occurred: {str(e)}")
+                self._publish("error", str(e))
+            finally:
+                if self._pending_start is None or self._pending_start[1] is not handled:
+                    self._resolve(handled)
+
+    @staticmethod
+    def _resolve(handled):
+        if handled is not None and not handled.done():
+            handled.set_result(None)
+
+    def _release_waiting(self):
+        """Resolve commands still queued at shutdown so the listener can finish"""
+        if self._pending_start is not None:
+            self._resolve(self._pending_start[1])
+            self._pending_start = None
+        while not self._events.empty():
+            self._resolve(self._events.get_nowait()[2])
+
+    async def _start(self, trigger, handled=None):
+        if self.state == RECORDING or self._stopping:
+            return
+        if self.state == SAVING:
+            if self._pending_start is not None:
+                return
+            print("\nStart command will be carried out once the last recording is saved.")
+            self._pending_start = (trigger, handled)
+            return
+        started = await self._loop.run_in_executor(self._worker, self.recorder.start_recording, trigger)
+        if started:
+            self._set_state(RECORDING)
+            print(f"\nRecording started! Say '{self.stop_command}' to end recording.")
+            self._publish("recording_started")
+
+    async def _stop(self, source):
+        if self.state == SAVING and self._pending_start is not None:
+            # Stopped again before the queued start could happen
+            self._resolve(self._pending_start[1])
+            self._pending_start = None
+            return
+        if self.state != RECORDING:
+            return
+        self._set_state(SAVING)
+        self._save_task = asyncio.create_task(self._save())
+        # Capture ends at once; writing the file out carries on in the background
+        while self.recorder.is_recording and not self._save_task.done():
+            await asyncio.sleep(0.005)
+
+    async def _save(self):
+        try:
+            filename = await self._loop.run_in_executor(self._worker, self.recorder.stop_recording)
+        except Exception as e:
+            print(f"\nError stopping recording: {str(e)}")
+            self._publish("error", str(e))
+            filename = None
+        if self._stopping:
+            await self._saved(filename)
+        else:
+            self._events.put_nowait(("saved", filename, None))
+
+    async def _saved(self, filename):
+        self._save_task = None
+        self._set_state(ARMED)
+        self._publish("recording_stopped", filename)
+        if filename and not self._stopping:
+            print(f"\nReady for next command... (Say '{self.start_command}' to start a new recording)")
+        if self._pending_start is not None:
+            trigger, handled = self._pending_start
+            self._pending_start = None
+            try:
+                await self._start(trigger)
+            finally:
+                self._resolve(handled)
+
+    def _on_capture_error(self, message):
+        """Recorder callback (on its thread): stop and save the recording"""
+        loop = self._loop
+        if loop is not None:
+            loop.call_soon_threadsafe(self._publish, "error", message)
+        self.post("stop", "capture error")
+
+    def _on_alert_status(self, alert):
+        """Dispatcher callback (on its thread): forward progress to the loop"""
+        loop = self._loop
+        if loop is not None:
+            # The alert keeps changing on the dispatcher thread; pass on this status
+            change = (id(alert), alert.status, alert.to_number)
+            loop.call_soon_threadsafe(self._events.put_nowait, ("alert", change, None))
+
+    def _alert_changed(self, change):
+        alert_id, status, to_number = change
+        if status in ("queued", "retrying"):
+            if not self._alerts:
+                self._publish("alerting", to_number)
+            self._alerts.add(alert_id)
+        else:
+            self._alerts.discard(alert_id)
+            # "alert_sent", "alert_failed" or "alert_deferred" (kept in the outbox)
+            self._publish(f"alert_{status}", to_number)
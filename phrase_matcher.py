@@ -0,0 +1,115 @@
+import re
+import threading
+from collections import deque
+
+_TOKEN = re.compile(r"[\w']+")
+
+
+def tokenize(text):
+    """Lowercase word tokens, ignoring punctuation"""
+    return _TOKEN.findall(text.lower())
+
+
+def _is_action(action):
+    """Whether action is "start", "stop" or "alert:<number>" """
+    if action in ("start", "stop"):
+        return True
+    return isinstance(action, str) and action.startswith("alert:") and len(action) > len("alert:")
+
+
+class PhraseMatch:
+    """A trigger phrase found in a hypothesis, ending at token `end`"""
+
+    def __init__(self, phrase, action, start, end):
+        self.phrase = phrase
+        self.action = action
+        self.start = start
+        self.end = end
+
+    def __repr__(self):
+        return f"PhraseMatch({self.phrase!r} -> {self.action!r}, tokens {self.start}:{self.end})"
+
+
+class PhraseMatcher:
+    """Find many trigger phrases in recognized text in one pass.
+
+    Phrases are compiled into an Aho-Corasick automaton over word tokens,
+    so matching costs the same however many phrases (triggers, contacts)
+    are configured, and whole words are matched ("helpful" does not
+    contain "help"). Each phrase maps to an action: "start", "stop" or
+    "alert:<number>".
+
+    The automaton is rebuilt whenever phrases are added and swapped in
+    whole, so search() can run on several threads at once without locking.
+    """
+
+    def __init__(self, phrases=None):
+        self._phrases = {}
+        self._lock = threading.Lock()
+        for phrase, action in (phrases or {}).items():
+            self._add(phrase, action)
+        self._compile()
+
+    def add(self, phrase, action):
+        with self._lock:
+            self._add(phrase, action)
+            self._compile()
+
+    def _add(self, phrase, action):
+        tokens = tuple(tokenize(phrase))
+        if not tokens:
+            raise ValueError(f"Trigger phrase has no words: {phrase!r}")
+        if not _is_action(action):
+            raise ValueError(f"Unknown action for {phrase!r}: {action!r} (use start, stop or alert:<number>)")
+        # Copy on write; the automaton being searched keeps the old dict
+        self._phrases = {**self._phrases, tokens: (" ".join(tokens), action)}
+
+    def _compile(self):
+        # Node 0 is the root; each node has goto edges, a failure link and
+        # the phrases (as token tuples) that end there
+        goto = [{}]
+        fail = [0]
+        out = [[]]
+        for tokens in self._phrases:
+            node = 0
+            for token in tokens:
+                if token not in goto[node]:
+                    goto.append({})
+                    fail.append(0)
+                    out.append([])
+                    goto[node][token] = len(goto) - 1
+                node = goto[node][token]
+            out[node].append(tokens)
+
+        pending = deque(goto[0].values())
+        while pending:
+            node = pending.popleft()
+            for token, child in goto[node].items():
+                pending.append(child)
+                if node:
+                    fallback = fail[node]
+                    while fallback and token not in goto[fallback]:
+                        fallback = fail[fallback]
+                    fail[child] = goto[fallback].get(token, 0)
+                # Longest phrase first among those ending at the same token
+                out[child] = out[child] + out[fail[child]]
+        self._automaton = (goto, fail, out, self._phrases)
+
+    def search(self, text):
+        """Return every phrase occurrence in text, earliest ending first"""
+        goto, fail, out, phrases = self._automaton
+        matches = []
+        node = 0
+        for index, token in enumerate(tokenize(text)):
+            while node and token not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(token, 0)
+            for tokens in out[node]:
+                phrase, action = phrases[tokens]
+                matches.append(PhraseMatch(phrase, action, index + 1 - len(tokens), index + 1))
+        return matches
+
+    def first(self, text):
+        """The earliest phrase to complete in text, or None"""
+        matches = self.search(text)
+        return matches[0] if matches else None
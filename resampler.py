@@ -0,0 +1,72 @@
+import time
+from math import gcd
+import numpy as np
+
+
+class PolyphaseResampler:
+    """Streaming rational-rate resampler for 16-bit PCM.
+
+    Converts from input_rate to output_rate by the ratio up/down (e.g.
+    160/441 for 44.1 kHz -> 16 kHz) with a windowed-sinc low-pass filter
+    split into `up` polyphase branches. Only the branch needed for each
+    output sample is evaluated, and all outputs of a chunk are computed
+    with one gather and one multiply-sum. The last few input samples are
+    carried between calls, so chunks can be fed one by one with the same
+    result as resampling the whole recording at once.
+    """
+
+    def __init__(self, input_rate, output_rate, channels=1, taps_per_phase=24):
+        divisor = gcd(input_rate, output_rate)
+        self.input_rate = input_rate
+        self.output_rate = output_rate
+        self.channels = channels
+        self.up = output_rate // divisor
+        self.down = input_rate // divisor
+        self.taps = taps_per_phase
+
+        # Low-pass prototype at the upsampled rate, cut off just below the
+        # lower of the two Nyquist frequencies
+        length = self.up * self.taps
+        cutoff = 0.45 / max(self.up, self.down)
+        n = np.arange(length) - (length - 1) / 2
+        prototype = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(length, 8.0) * self.up
+        # branches[p, k] = prototype[p + k * up]
+        self._branches = prototype.reshape(self.taps, self.up).T.astype(np.float32)
+        self._history = np.zeros((self.taps - 1, channels), dtype=np.float32)
+        self._inputs = 0  # Input frames consumed so far
+        self._outputs = 0  # Output frames produced so far
+        self.cpu_seconds = 0.0
+
+    @property
+    def audio_seconds(self):
+        """Seconds of input audio processed so far"""
+        return self._inputs / self.input_rate
+
+    @property
+    def cpu_per_audio_second(self):
+        """CPU seconds spent per second of audio resampled"""
+        return self.cpu_seconds / self.audio_seconds if self._inputs else 0.0
+
+    def process(self, pcm):
+        """Resample a chunk of 16-bit PCM and return the output bytes"""
+        started = time.thread_time()
+        samples = np.frombuffer(pcm, dtype=np.int16).reshape(-1, self.channels).astype(np.float32)
+        extended = np.concatenate((self._history, samples))
+        first_input = self._inputs - (self.taps - 1)  # Stream index of extended[0]
+        self._inputs += len(samples)
+
+        # Every output whose newest input sample has arrived
+        end = (self._inputs * self.up - 1) // self.down + 1
+        outputs = np.arange(self._outputs, end)
+        self._outputs = end
+        positions = outputs * self.down
+        phases = positions % self.up
+        newest = positions // self.up - first_input
+        # window[n, k] = extended[newest[n] - k]
+        window = extended[newest[:, None] - np.arange(self.taps)[None, :]]
+        result = np.einsum('nk,nkc->nc', self._branches[phases], window)
+
+        self._history = extended[len(extended) - (self.taps - 1):]
+        out = np.clip(np.rint(result), -32768, 32767).astype(np.int16).tobytes()
+        self.cpu_seconds += time.thread_time() - started
+        return out
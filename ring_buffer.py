@@ -0,0 +1,122 @@
+class RingBuffer:
+    """Fixed-size byte ring holding the most recent audio.
+
+    The backing bytearray is allocated once; writes copy into it in place
+    and views() hands out memoryviews of the contents, so keeping the last
+    few seconds of audio around costs no per-chunk allocation.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+        self._pos = 0
+        self._full = False
+
+    def __len__(self):
+        return self.size if self._full else self._pos
+
+    def write(self, data):
+        """Copy data into the ring, overwriting the oldest bytes"""
+        if self.size == 0:
+            return
+        data = memoryview(data).cast('B')
+        length = len(data)
+        if length >= self.size:
+            self._view[:] = data[length - self.size:]
+            self._pos = 0
+            self._full = True
+            return
+
+        end = self._pos + length
+        if end <= self.size:
+            self._view[self._pos:end] = data
+        else:
+            split = self.size - self._pos
+            self._view[self._pos:] = data[:split]
+            self._view[:length - split] = data[split:]
+        if end >= self.size:
+            self._full = True
+        self._pos = end % self.size
+
+    def views(self):
+        """Return memoryviews of the contents, oldest first.
+
+        The views alias the ring, so they are only valid until the next write.
+        """
+        if not self._full:
+            return [self._view[:self._pos]]
+        return [self._view[self._pos:], self._view[:self._pos]]
+
+    def clear(self):
+        """Forget the buffered audio without touching the allocation"""
+        self._pos = 0
+        self._full = False
+
+
+class SPSCRingBuffer:
+    """Byte ring handing audio from one producer thread to one consumer.
+
+    The producer only advances `_written` and the consumer only advances
+    `_read` (running byte totals that never wrap), so neither side takes
+    a lock. Writes copy into the buffer allocated up front; a write that
+    does not fit because the consumer has fallen behind is dropped whole
+    and counted in `overruns`, so the producer never waits.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.overruns = 0
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+        self._written = 0
+        self._read = 0
+
+    @property
+    def total_written(self):
+        """Bytes written since the ring was created"""
+        return self._written
+
+    @property
+    def total_read(self):
+        """Bytes read (or cleared) since the ring was created"""
+        return self._read
+
+    def available(self):
+        """Number of bytes ready to be read"""
+        return self._written - self._read
+
+    def write(self, data):
+        """Copy data in (producer side); returns False if it was dropped"""
+        data = memoryview(data).cast('B')
+        length = len(data)
+        if length > self.size - (self._written - self._read):
+            self.overruns += 1
+            return False
+        start = self._written % self.size
+        end = start + length
+        if end <= self.size:
+            self._view[start:end] = data
+        else:
+            split = self.size - start
+            self._view[start:] = data[:split]
+            self._view[:length - split] = data[split:]
+        # Publish only after the bytes are in place
+        self._written += length
+        return True
+
+    def read(self, size):
+        """Copy out up to size bytes (consumer side)"""
+        size = min(size, self._written - self._read)
+        start = self._read % self.size
+        end = start + size
+        if end <= self.size:
+            data = bytes(self._view[start:end])
+        else:
+            data = bytes(self._view[start:]) + bytes(self._view[:end - self.size])
+        self._read += size
+        return data
+
+    def clear(self):
+        """Drop unread data; only safe while the producer is stopped"""
+        self._read = self._written
@@ -0,0 +1,185 @@
+"""
+Scripted simulation of a recording session in virtual time.
+
+Runs the real VoiceDetector, AudioRecorder and main loop in simulation
+mode, but phrases come from a script instead of the keyboard and the
+recorder's clock is a VirtualClock that jumps straight to the next
+scripted phrase, so an hour-long recording takes seconds to simulate.
+
+A script is a JSON file:
+
+    {"start_command": "help", "stop_command": "stop", "number": "+15550100",
+     "phrases": {"call mom": "alert:+15551234567"},
+     "audio": "fixtures/street.wav",
+     "events": [{"time": 5, "say": "help"},
+                {"time": 3605, "say": "stop"}]}
+
+Only "events" is required. "audio" is a 16-bit WAV looped as the
+simulated input (silence without it).
+
+Usage:
+    python simulation.py script.json [--directory recordings] [--segment-seconds 60] [--json]
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import wave
+
+from audio_recorder import AudioRecorder
+from capture import CapturePipeline
+from clock import VirtualClock
+from main import run
+from messaging import AlertDispatcher, MemoryTransport
+from voice_detector import VoiceDetector
+
+
+class LoopedAudio:
+    """Simulated input that loops the PCM of a WAV file"""
+
+    def __init__(self, path):
+        with wave.open(path, 'rb') as wf:
+            if wf.getsampwidth() != 2:
+                raise ValueError(f"{path} is not 16-bit audio")
+            self.sample_rate = wf.getframerate()
+            self.channels = wf.getnchannels()
+            self.pcm = wf.readframes(wf.getnframes())
+        if not self.pcm:
+            raise ValueError(f"{path} has no audio")
+        self.frame_size = 2 * self.channels
+        self._offset = 0
+
+    def __call__(self, frames):
+        size = frames * self.frame_size
+        data = bytearray()
+        while len(data) < size:
+            part = self.pcm[self._offset:self._offset + size - len(data)]
+            data += part
+            self._offset = (self._offset + len(part)) % len(self.pcm)
+        return bytes(data)
+
+
+class SimulationDriver:
+    """Play a script of phrases against the detector and recorder in virtual time.
+
+    Each call the detector makes for the next phrase advances the clock
+    to that phrase's time, in steps of step seconds so the recorder
+    writes audio as time passes rather than in one burst. The run ends
+    after the last phrase, stopping any recording still in progress.
+    """
+
+    def __init__(self, script, directory="recordings", step=1.0, sample_rate=16000, segment_seconds=None,
+                 catalog=None):
+        self.start_command = script.get("start_command", "help")
+        self.stop_command = script.get("stop_command", "stop")
+        self.number = script.get("number", "+10000000000")
+        self.phrases = script.get("phrases")
+        self.audio = LoopedAudio(script["audio"]) if script.get("audio") else None
+        self.sample_rate = self.audio.sample_rate if self.audio else sample_rate
+        self.channels = self.audio.channels if self.audio else 1
+        self.events = sorted(script["events"], key=lambda event: event["time"])
+        self.directory = directory
+        self.step = step
+        self.segment_seconds = segment_seconds
+        self.catalog = catalog
+        self.clock = VirtualClock()
+        self.transport = MemoryTransport()
+        self.log = []
+        self.recorder = None
+        self._pending = list(self.events)
+        self._stop_event = threading.Event()
+
+    def _next_phrase(self):
+        """Advance to the next scripted phrase and return it"""
+        if not self._pending:
+            self._stop_event.set()
+            return None
+        event = self._pending.pop(0)
+        self.advance_to(event["time"])
+        self.log.append((self.clock.monotonic(), "said", event["say"]))
+        return event["say"]
+
+    def advance_to(self, when):
+        while self.clock.monotonic() < when:
+            self.clock.advance(min(self.step, when - self.clock.monotonic()))
+            if self.recorder is not None:
+                self.recorder.simulate_until(self.clock.monotonic())
+
+    def _on_event(self, event, detail=None):
+        self.log.append((self.clock.monotonic(), event, detail))
+
+    def run(self):
+        """Run the whole script and return a summary of what happened"""
+        os.makedirs(self.directory, exist_ok=True)
+        capture = CapturePipeline(sample_rate=self.sample_rate, channels=self.channels, simulate=True)
+        dispatcher = AlertDispatcher(transport=self.transport)
+        detector = VoiceDetector(self.start_command, self.stop_command, self.number, capture=capture,
+                                 dispatcher=dispatcher, vad=False, phrases=self.phrases,
+                                 commands=self._next_phrase)
+        self.recorder = AudioRecorder(pre_roll_seconds=0, capture=capture, segment_seconds=self.segment_seconds,
+                                      directory=self.directory, catalog=self.catalog, clock=self.clock,
+                                      simulated_audio=self.audio)
+        started = time.perf_counter()
+        try:
+            run(detector, self.recorder, self.start_command, self.stop_command,
+                stop_event=self._stop_event, on_event=self._on_event)
+        finally:
+            dispatcher.stop()
+        wall_seconds = time.perf_counter() - started
+        return self.summary(wall_seconds)
+
+    def summary(self, wall_seconds):
+        from wav_reader import open_recording
+        recordings = []
+        for _, event, detail in self.log:
+            if event == "recording_stopped" and detail:
+                with open_recording(detail) as reader:
+                    recordings.append({"path": detail, "duration": reader.duration})
+        virtual_seconds = self.clock.monotonic()
+        return {
+            "virtual_seconds": virtual_seconds,
+            "wall_seconds": wall_seconds,
+            "speedup": virtual_seconds / wall_seconds if wall_seconds else None,
+            "recordings": recordings,
+            "alerts": [{"to": to, "message": message} for to, message in self.transport.sent],
+            "events": [{"time": at, "event": event, "detail": detail} for at, event, detail in self.log],
+        }
+
+
+def print_report(summary):
+    print("\n=== Simulation results ===")
+    print(f"Simulated {summary['virtual_seconds']:.1f} s in {summary['wall_seconds']:.2f} s "
+          f"({summary['speedup'] or 0:.0f}x real time)")
+    for event in summary["events"]:
+        detail = f": {event['detail']}" if event["detail"] else ""
+        print(f"{event['time']:10.1f} s  {event['event']}{detail}")
+    for recording in summary["recordings"]:
+        print(f"Recording {recording['path']}: {recording['duration']:.1f} s")
+    print(f"Alerts sent: {len(summary['alerts'])}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a scripted session in virtual time")
+    parser.add_argument("script", help="JSON script of timed phrases")
+    parser.add_argument("--directory", default="recordings", help="Where to save the simulated recordings")
+    parser.add_argument("--step", type=float, default=1.0, help="Virtual seconds per clock step")
+    parser.add_argument("--segment-seconds", type=float, default=None, help="Split recordings into segments")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args(argv)
+
+    with open(args.script) as f:
+        script = json.load(f)
+    driver = SimulationDriver(script, directory=args.directory, step=args.step,
+                              segment_seconds=args.segment_seconds)
+    summary = driver.run()
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_report(summary)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
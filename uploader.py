@@ -0,0 +1,396 @@
+"""
+Background upload of finished recordings to an HTTP endpoint.
+
+Files are sent in chunks with a small resumable protocol, so an upload
+cut off by a lost connection (or a restart) continues where it stopped:
+
+    HEAD  <url>/<name>   -> 200 with "Upload-Offset: <bytes stored>", or 404
+    PATCH <url>/<name>   with "Upload-Offset: <start>" and "Upload-Length:
+                         <file size>", body = the next chunk
+                         -> 204 with the new "Upload-Offset", or 409 with the
+                            server's offset if the client is out of step
+
+<name> is the file's path relative to the recordings directory. Run
+`python uploader.py serve STORAGE_DIR` for a local endpoint (also handy
+for testing), and `python uploader.py push URL [DIRECTORY]` to upload
+everything in a directory by hand.
+"""
+import argparse
+import http.client
+import os
+import sys
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from metrics import default_registry
+
+_UPLOADED_BYTES = default_registry.counter("stealthrec_uploaded_bytes_total", "Recording bytes uploaded")
+_UPLOADS = {
+    status: default_registry.counter("stealthrec_uploads_total", "Recording uploads finished", status=status)
+    for status in ("uploaded", "skipped", "failed")
+}
+
+# Files in the recordings directory that are not recordings
+_SKIPPED_SUFFIXES = (".tmp", ".db", ".db-wal", ".db-shm", ".db-journal")
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class ConnectionPool:
+    """Keep-alive HTTP(S) connections to one endpoint, shared by workers.
+
+    At most `size` requests are in flight; idle connections are reused,
+    so a stream of chunk uploads costs one TCP/TLS handshake instead of
+    one per request.
+    """
+
+    def __init__(self, url, size=1, timeout=30.0):
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError(f"Upload URL must be http(s)://host[:port]/path, got {url!r}")
+        self._connection_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        self.host = parts.hostname
+        self.port = parts.port
+        self.base_path = parts.path.rstrip("/") + "/"
+        self.timeout = timeout
+        self.connections_opened = 0
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def request(self, method, name, body=None, headers=None):
+        """Send a request for `name` under the base URL; returns
+        (status, lowercase headers, body)"""
+        path = self.base_path + urllib.parse.quote(name)
+        with self._slots:
+            with self._lock:
+                connection = self._idle.pop() if self._idle else None
+            if connection is not None:
+                try:
+                    return self._send(connection, method, path, body, headers)
+                except (http.client.HTTPException, OSError):
+                    # The server may have closed the idle connection; retry
+                    # once on a new one (the upload offsets make this safe)
+                    connection.close()
+            return self._send(self._connect(), method, path, body, headers)
+
+    def _connect(self):
+        self.connections_opened += 1
+        return self._connection_class(self.host, self.port, timeout=self.timeout)
+
+    def _send(self, connection, method, path, body, headers):
+        try:
+            connection.request(method, path, body=body, headers=headers or {})
+            response = connection.getresponse()
+            data = response.read()
+        except Exception:
+            connection.close()
+            raise
+        if response.will_close:
+            connection.close()
+        else:
+            with self._lock:
+                self._idle.append(connection)
+        return response.status, {name.lower(): value for name, value in response.getheaders()}, data
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+
+class RateLimiter:
+    """Token bucket shared by all workers: rate bytes per second on
+    average, in bursts of at most burst bytes"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, amount):
+        """Take amount bytes from the bucket, sleeping off any shortfall"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= amount
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+
+
+class RecordingUploader:
+    """Upload finished recordings in the background.
+
+    Files queued with submit() are sent by `concurrency` workers over a
+    pooled keep-alive connection, in chunk_size pieces, throttled to
+    max_bytes_per_second in total so uploads never compete with capture
+    for bandwidth or CPU. Uploads resume from the server's offset after
+    errors (retried with exponential backoff) and across restarts;
+    submit_directory() requeues everything, and files the server already
+    has in full are skipped after a single HEAD request.
+    """
+
+    def __init__(self, url, root="recordings", token=None, concurrency=1, chunk_size=256 * 1024,
+                 max_bytes_per_second=None, max_attempts=5, backoff=2.0, max_backoff=300.0, timeout=30.0,
+                 on_uploaded=None):
+        self.connections = ConnectionPool(url, size=concurrency, timeout=timeout)
+        self.root = root
+        self.token = token
+        self.chunk_size = chunk_size
+        self.limiter = RateLimiter(max_bytes_per_second) if max_bytes_per_second else None
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.on_uploaded = on_uploaded
+        self.stats = {"uploaded": 0, "skipped": 0, "failed": 0, "bytes": 0, "seconds": 0.0}
+        self._lock = threading.Lock()
+        self._closing = threading.Event()
+        self._pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="uploader")
+
+    def submit(self, path):
+        """Queue a finished file for upload; returns a Future of the result,
+        or None once shut down (the file is picked up by the next run)"""
+        if self._closing.is_set():
+            return None
+        return self._pool.submit(self._upload_with_retries, path)
+
+    def submit_directory(self, directory=None):
+        """Queue every file under directory (the recordings root by default)"""
+        queued = 0
+        for folder, _, names in os.walk(directory or self.root):
+            for name in sorted(names):
+                if not name.endswith(_SKIPPED_SUFFIXES):
+                    self.submit(os.path.join(folder, name))
+                    queued += 1
+        return queued
+
+    def remote_name(self, path):
+        """Name of a file on the server: its path relative to the recordings root"""
+        relative = os.path.relpath(path, self.root)
+        if relative.startswith(os.pardir):
+            relative = os.path.basename(path)
+        return relative.replace(os.sep, "/")
+
+    def _headers(self, extra=None):
+        headers = dict(extra or {})
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        return headers
+
+    def _upload_with_retries(self, path):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                return self._upload(path)
+            except Exception as e:
+                if self._closing.is_set():
+                    # Stopped on purpose; the upload resumes on the next run
+                    return None
+                if attempt == self.max_attempts or not self._is_retryable(e):
+                    print(f"\nError uploading {path}: {str(e)}")
+                    self._count("failed")
+                    return None
+                delay = min(self.backoff * 2 ** (attempt - 1), self.max_backoff)
+                print(f"\nWarning: Upload of {path} failed ({str(e)}), retrying in {delay:.0f}s...")
+                if self._closing.wait(delay):
+                    return None
+
+    def _upload(self, path):
+        started = time.monotonic()
+        name = self.remote_name(path)
+        size = os.path.getsize(path)
+        status, headers, _ = self.connections.request("HEAD", name, headers=self._headers())
+        if status == 404:
+            offset = 0
+        elif status == 200:
+            offset = int(headers.get("upload-offset", 0))
+        else:
+            raise UploadError(f"HEAD {name} returned {status}", status)
+        if offset >= size:
+            self._count("skipped")
+            return {"path": path, "name": name, "bytes": 0, "skipped": True}
+
+        sent = 0
+        with open(path, 'rb') as f:
+            while offset < size:
+                if self._closing.is_set():
+                    raise UploadError("uploader is shutting down")
+                f.seek(offset)
+                data = f.read(min(self.chunk_size, size - offset))
+                if self.limiter is not None:
+                    self.limiter.consume(len(data))
+                status, headers, _ = self.connections.request("PATCH", name, body=data, headers=self._headers({
+                    "Upload-Offset": str(offset),
+                    "Upload-Length": str(size),
+                    "Content-Type": "application/offset+octet-stream",
+                }))
+                if status == 409 and "upload-offset" in headers:
+                    # Out of step with the server (e.g. a retried chunk was stored); continue from its offset
+                    offset = int(headers["upload-offset"])
+                    continue
+                if status not in (200, 201, 204):
+                    raise UploadError(f"PATCH {name} returned {status}", status)
+                offset = int(headers.get("upload-offset", offset + len(data)))
+                sent += len(data)
+                _UPLOADED_BYTES.inc(len(data))
+
+        seconds = time.monotonic() - started
+        with self._lock:
+            self.stats["bytes"] += sent
+            self.stats["seconds"] += seconds
+        self._count("uploaded")
+        result = {"path": path, "name": name, "bytes": sent, "seconds": seconds, "skipped": False}
+        if self.on_uploaded:
+            self.on_uploaded(result)
+        return result
+
+    def _count(self, outcome):
+        _UPLOADS[outcome].inc()
+        with self._lock:
+            self.stats[outcome] += 1
+
+    @staticmethod
+    def _is_retryable(error):
+        """Client errors (bad token, bad name) will not fix themselves"""
+        status = getattr(error, 'status', None)
+        if isinstance(status, int) and 400 <= status < 500 and status not in (408, 409, 429):
+            return False
+        return True
+
+    def summary(self):
+        """Totals so far, with the average upload throughput"""
+        with self._lock:
+            stats = dict(self.stats)
+        stats["bytes_per_second"] = stats["bytes"] / stats["seconds"] if stats["seconds"] else 0.0
+        stats["connections_opened"] = self.connections.connections_opened
+        return stats
+
+    def shutdown(self, wait=True):
+        """Finish queued uploads (wait=True), or stop after the current chunks;
+        unfinished files resume on the next submit"""
+        if not wait:
+            self._closing.set()
+        self._pool.shutdown(wait=wait, cancel_futures=not wait)
+        self.connections.close()
+
+
+class UploadHandler(BaseHTTPRequestHandler):
+    """Stand-in endpoint storing uploads under server.storage"""
+
+    protocol_version = "HTTP/1.1"
+
+    def _target(self):
+        name = urllib.parse.unquote(urllib.parse.urlsplit(self.path).path).lstrip("/")
+        storage = os.path.realpath(self.server.storage)
+        target = os.path.realpath(os.path.join(storage, name))
+        if not name or os.path.commonpath([storage, target]) != storage:
+            return None
+        return target
+
+    def _reply(self, status, offset=None):
+        self.send_response(status)
+        if offset is not None:
+            self.send_header("Upload-Offset", str(offset))
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _authorized(self):
+        if self.server.token and self.headers.get("Authorization") != f"Bearer {self.server.token}":
+            self._reply(401)
+            return False
+        return True
+
+    def do_HEAD(self):
+        target = self._target()
+        if not self._authorized():
+            return
+        if target is None:
+            self._reply(400)
+        elif os.path.isfile(target):
+            self._reply(200, os.path.getsize(target))
+        else:
+            self._reply(404)
+
+    def do_PATCH(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        target = self._target()
+        if not self._authorized():
+            return
+        if target is None:
+            self._reply(400)
+            return
+        with self.server.lock:
+            current = os.path.getsize(target) if os.path.isfile(target) else 0
+            if int(self.headers.get("Upload-Offset", -1)) != current:
+                self._reply(409, current)
+                return
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, 'ab') as f:
+                f.write(body)
+            self._reply(204, current + len(body))
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(storage, host="127.0.0.1", port=8765, token=None):
+    """Return a ThreadingHTTPServer accepting uploads into storage
+    (call serve_forever() on it)"""
+    server = ThreadingHTTPServer((host, port), UploadHandler)
+    server.storage = storage
+    server.token = token
+    server.lock = threading.Lock()
+    os.makedirs(storage, exist_ok=True)
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Upload recordings, or run a local upload endpoint")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="Accept uploads into a directory")
+    serve_parser.add_argument("storage")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    serve_parser.add_argument("--token")
+    push_parser = commands.add_parser("push", help="Upload every file in a recordings directory")
+    push_parser.add_argument("url")
+    push_parser.add_argument("directory", nargs="?", default="recordings")
+    push_parser.add_argument("--token")
+    push_parser.add_argument("--concurrency", type=int, default=2)
+    push_parser.add_argument("--limit", type=float, default=None, help="Bytes per second across all uploads")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        server = serve(args.storage, args.host, args.port, args.token)
+        print(f"Accepting uploads into {args.storage} on http://{args.host}:{args.port}/")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    uploader = RecordingUploader(args.url, root=args.directory, token=args.token, concurrency=args.concurrency,
+                                 max_bytes_per_second=args.limit)
+    queued = uploader.submit_directory()
+    uploader.shutdown()
+    stats = uploader.summary()
+    print(f"{queued} files: {stats['uploaded']} uploaded, {stats['skipped']} already uploaded, "
+          f"{stats['failed']} failed; "
+          f"{stats['bytes']} bytes at {stats['bytes_per_second'] / 1024:.0f} KiB/s over "
+          f"{stats['connections_opened']} connections")
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+import threading
+import numpy as np
+
+
+class VoiceActivityGate:
+    """Decide cheaply whether audio contains speech before recognizing it.
+
+    Audio is split into short frames and each frame's RMS energy and
+    zero-crossing rate are computed in one pass over a 2-D view. A frame
+    counts as speech when it is well above the noise floor and not
+    noise-like (broadband noise crosses zero about every other sample).
+    The noise floor follows the frames that are not speech: it drops
+    quickly when the room gets quieter and rises slowly when it gets
+    louder. Frames that look like speech only nudge it up very slowly, so
+    talking does not raise it but a lasting change in background noise
+    is still picked up.
+    """
+
+    def __init__(self, sample_rate, sample_width=2, frame_ms=20, energy_ratio=3.0, max_zcr=0.35,
+                 min_speech_ms=150, initial_floor=100.0, rise_rate=0.01, fall_rate=0.5):
+        if sample_width != 2:
+            raise ValueError("VoiceActivityGate expects 16-bit audio")
+        self.sample_rate = sample_rate
+        self.frame_length = max(1, int(sample_rate * frame_ms / 1000))
+        self.frame_ms = frame_ms
+        self.energy_ratio = energy_ratio
+        self.max_zcr = max_zcr
+        self.min_speech_frames = max(1, int(min_speech_ms / frame_ms))
+        self.noise_floor = initial_floor
+        self.rise_rate = rise_rate
+        self.fall_rate = fall_rate
+        self.segments_forwarded = 0
+        self.segments_skipped = 0
+        self._subscription = None
+        self._thread = None
+
+    @property
+    def energy_threshold(self):
+        """RMS level above which audio is treated as speech"""
+        return self.noise_floor * self.energy_ratio
+
+    def _features(self, pcm):
+        """Per-frame RMS energy and zero-crossing rate"""
+        samples = np.frombuffer(pcm, dtype=np.int16)
+        count = len(samples) // self.frame_length
+        if count == 0:
+            return np.empty(0), np.empty(0)
+        frames = samples[:count * self.frame_length].reshape(count, self.frame_length).astype(np.float32)
+        rms = np.sqrt(np.mean(frames * frames, axis=1))
+        crossings = np.count_nonzero(np.diff(np.signbit(frames), axis=1), axis=1)
+        return rms, crossings / self.frame_length
+
+    def _speech_mask(self, rms, zcr):
+        return (rms > self.energy_threshold) & (zcr < self.max_zcr)
+
+    def _update_floor(self, rms, rise_rate=None):
+        """Move the noise floor toward the quietest frames of this block"""
+        if len(rms) == 0:
+            return
+        target = float(np.percentile(rms, 20))
+        if target < self.noise_floor:
+            rate = self.fall_rate
+        else:
+            rate = self.rise_rate if rise_rate is None else rise_rate
+        self.noise_floor += rate * (target - self.noise_floor)
+        # Digital silence would otherwise make every sound look like speech
+        self.noise_floor = max(self.noise_floor, 1.0)
+
+    def observe(self, pcm):
+        """Feed background audio to keep the noise floor current"""
+        rms, zcr = self._features(pcm)
+        speech = self._speech_mask(rms, zcr)
+        if speech.all():
+            self._update_floor(rms, rise_rate=self.rise_rate * 0.1)
+        else:
+            self._update_floor(rms[~speech])
+
+    def is_speech(self, pcm):
+        """Return True if the segment should be sent for recognition"""
+        rms, zcr = self._features(pcm)
+        speech_frames = int(np.count_nonzero(self._speech_mask(rms, zcr)))
+        if speech_frames >= self.min_speech_frames:
+            self.segments_forwarded += 1
+            return True
+        # A segment without speech is a fresh noise sample
+        self._update_floor(rms)
+        self.segments_skipped += 1
+        return False
+
+    def track(self, capture):
+        """Follow the noise floor from a capture pipeline in the background"""
+        if self._thread is not None:
+            return
+        self._subscription = capture.subscribe("vad", maxsize=16)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        capture.start()
+
+    def _run(self):
+        while True:
+            chunk = self._subscription.read()
+            if not chunk:
+                break
+            self.observe(chunk)
+
+    def stop(self, capture):
+        """Stop background noise-floor tracking"""
+        if self._subscription is not None:
+            capture.unsubscribe(self._subscription)
+            self._thread.join(timeout=2.0)
+            self._subscription = None
+            self._thread = None
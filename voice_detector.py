@@ -1,24 +1,114 @@
 import speech_recognition as sr
-from messaging import send_alert_message
+from messaging import AlertDispatcher, AlertOutbox
+from continuous_recognition import ContinuousRecognizer
+from metrics import default_registry
+from phrase_matcher import PhraseMatcher
 from utils import get_command_keywords
 from datetime import datetime
+import os
 import sys
+import wave
+
+_LISTEN_LATENCY = default_registry.histogram(
+    "stealthrec_stage_seconds", "Time spent in each stage of the pipeline", stage="listen")
+_RECOGNIZE_LATENCY = default_registry.histogram(
+    "stealthrec_stage_seconds", "Time spent in each stage of the pipeline", stage="recognize")
+_SKIPPED_PHRASES = default_registry.counter(
+    "stealthrec_phrases_skipped_total", "Phrases not recognized because they contained no speech")
+_COMMANDS = {
+    command: default_registry.counter("stealthrec_commands_total", "Commands detected", command=command)
+    for command in ("start", "stop", "alert")
+}
+
+class CaptureSource(sr.AudioSource):
+    """speech_recognition audio source fed by a shared CapturePipeline.
+
+    The subscription stays open between listens, so audio arriving while
+    a phrase is being recognized is queued instead of lost.
+    """
+
+    def __init__(self, capture, buffer_seconds=5):
+        self.capture = capture
+        self.SAMPLE_RATE = capture.sample_rate
+        self.SAMPLE_WIDTH = capture.sample_width
+        self.CHUNK = capture.chunk_size
+        self.buffer_seconds = buffer_seconds
+        self.stream = None
+
+    def __enter__(self):
+        if self.stream is None or self.stream.closed:
+            maxsize = int(self.buffer_seconds * self.SAMPLE_RATE / self.CHUNK)
+            self.stream = self.capture.subscribe("detector", maxsize=maxsize)
+        self.capture.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def close(self):
+        """Leave the capture pipeline"""
+        if self.stream is not None:
+            self.capture.unsubscribe(self.stream)
+            self.stream = None
 
 class VoiceDetector:
-    def __init__(self, start_command="help", stop_command="stop", sen_number="+917300218689"):
+    def __init__(self, start_command="help", stop_command="stop", sen_number="+917300218689", capture=None,
+                 engine="google", keywords_dir="keywords", dispatcher=None, continuous=False,
+                 vad=True, phrases=None, commands=None):
         self.recognizer = sr.Recognizer()
         self.start_command = start_command.lower()
         self.stop_command = stop_command.lower()
         self.sen_number  = sen_number.lower()
+        # Every trigger phrase maps to an action: "start", "stop", or
+        # "alert:<number>" to alert that contact; extra phrases may be given
+        self.matcher = PhraseMatcher({self.start_command: "start", self.stop_command: "stop", **(phrases or {})})
         self.simulation_mode = False
+        # In simulation mode, commands() supplies each phrase (None for
+        # silence) instead of the keyboard, so sessions can be scripted
+        self.commands = commands
+        # Alerts are recorded in the outbox and sent in the background,
+        # so they survive outages and never delay recording
+        self.dispatcher = dispatcher if dispatcher is not None else AlertDispatcher(outbox=AlertOutbox())
+        self.dispatcher.add_status_callback(self._on_alert_status)
+        if self.dispatcher.outbox is not None:
+            # Replay alerts left undelivered by a previous run right away
+            self.dispatcher.start()
+        # "google" sends each phrase to Google Speech Recognition; "keyword"
+        # matches it on-device against samples enrolled in keywords_dir
+        self.engine = engine
+        self.keywords_dir = keywords_dir
+        self.spotter = None
+        if engine == "keyword":
+            from keyword_spotter import KeywordSpotter
+            self.spotter = KeywordSpotter()
+            enrolled = self.spotter.load_directory(keywords_dir)
+            print(f"\nOffline keyword spotting enabled ({enrolled} samples loaded from '{keywords_dir}').")
+            if not enrolled:
+                print("No keyword samples found; run enroll_keyword() for 'start' and 'stop' first.")
+        elif engine != "google":
+            raise ValueError(f"Unknown recognition engine: {engine}")
+        # Voice activity gate: only phrases that contain speech are recognized
+        self.vad = None
         try:
-            # Try to initialize microphone
-            self.microphone = sr.Microphone()
-            # Adjust for ambient noise
-            with self.microphone as source:
-                print("\nCalibrating microphone for ambient noise...")
-                self.recognizer.adjust_for_ambient_noise(source, duration=1)
-                print("Microphone calibrated.")
+            if capture is not None and capture.is_simulation_mode:
+                raise OSError("no audio input device available")
+            # Listen through the shared capture pipeline when given one,
+            # otherwise open the microphone directly
+            self.microphone = CaptureSource(capture) if capture is not None else sr.Microphone()
+            if vad:
+                from vad import VoiceActivityGate
+                self.vad = VoiceActivityGate(self.microphone.SAMPLE_RATE, self.microphone.SAMPLE_WIDTH)
+            if self.vad is not None and capture is not None:
+                # The gate follows the noise floor from the shared capture
+                # stream, so no blocking calibration is needed
+                self.vad.track(capture)
+                print("\nTracking ambient noise in the background.")
+            else:
+                # Adjust for ambient noise
+                with self.microphone as source:
+                    print("\nCalibrating microphone for ambient noise...")
+                    self.recognizer.adjust_for_ambient_noise(source, duration=1)
+                    print("Microphone calibrated.")
         except (OSError, sr.RequestError) as e:
             print("\nError initializing microphone:")
             print("Please ensure you have a working microphone connected.")
@@ -26,24 +116,137 @@ class VoiceDetector:
             print("\nEntering simulation mode.")
             self.simulation_mode = True
 
-    def _send_recording_alert(self):
+        # Continuous mode recognizes overlapping windows of the shared
+        # capture stream in the background instead of listen/recognize turns
+        self.continuous = None
+        if continuous and not self.simulation_mode:
+            if capture is None:
+                print("\nContinuous recognition needs a shared capture pipeline; using phrase listening.")
+            else:
+                self.continuous = ContinuousRecognizer(capture, self._recognize_pcm, self._match_command)
+                self.continuous.start()
+
+    def _send_recording_alert(self, to_number=None, reason="recorder activated"):
         """Send alert message when recording spythontarts"""
         try:
             mode_info = " (Simulation)" if self.simulation_mode else ""
-            alert_message = f"recorder activated{mode_info}"
-            print(f"\nAttempting to send alert message: {alert_message}")
-            if send_alert_message(self.sen_number, alert_message):
-                print("\nEmergency contact alert sent successfully!")
-            else:
-                print("\nWarning: Could not send emergency contact alert.")
+            alert_message = f"{reason}{mode_info}"
+            print(f"\nQueueing alert message: {alert_message}")
+            self.dispatcher.submit(to_number or self.sen_number, alert_message)
         except Exception as e:
             print(f"\nWarning: Failed to send alert message: {str(e)}")
 
+    def _on_alert_status(self, alert):
+        """Report delivery progress of alerts sent by the dispatcher"""
+        if alert.status == "sent":
+            print(f"\nEmergency contact alert sent successfully! (SID: {alert.sid})")
+        elif alert.status == "retrying":
+            print(f"\nWarning: Alert attempt {alert.attempts} failed ({alert.error}), retrying...")
+        elif alert.status == "failed":
+            print(f"\nWarning: Could not send emergency contact alert: {alert.error}")
+
+    def enroll_keyword(self, command, samples=3):
+        """Record spoken samples of a command ('start' or 'stop') for the
+        offline keyword engine and save them under keywords_dir"""
+        if self.spotter is None or self.simulation_mode:
+            print("\nKeyword enrollment needs the 'keyword' engine and a microphone.")
+            return 0
+
+        word = self.start_command if command == "start" else self.stop_command
+        label_dir = os.path.join(self.keywords_dir, command)
+        os.makedirs(label_dir, exist_ok=True)
+        enrolled = 0
+        with self.microphone as source:
+            for _ in range(samples):
+                print(f"\nSay '{word}'...")
+                try:
+                    audio = self.recognizer.listen(source, timeout=5, phrase_time_limit=2)
+                except sr.WaitTimeoutError:
+                    print("Nothing heard, skipping sample.")
+                    continue
+                pcm = audio.get_raw_data(convert_rate=16000, convert_width=2)
+                filename = os.path.join(label_dir, f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.wav")
+                with wave.open(filename, 'wb') as wf:
+                    wf.setnchannels(1)
+                    wf.setsampwidth(2)
+                    wf.setframerate(16000)
+                    wf.writeframes(pcm)
+                self.spotter.enroll(command, pcm, 16000)
+                enrolled += 1
+        print(f"\nEnrolled {enrolled} samples of '{word}'.")
+        return enrolled
+
+    def _recognize(self, audio):
+        """Turn a captured phrase into lowercase text with the selected engine"""
+        with _RECOGNIZE_LATENCY.time():
+            return self._run_engine(audio)
+
+    def _run_engine(self, audio):
+        if self.spotter is not None:
+            label = self.spotter.detect(audio.get_raw_data(convert_rate=16000, convert_width=2), 16000)
+            if label is None:
+                raise sr.UnknownValueError()
+            return {"start": self.start_command, "stop": self.stop_command}.get(label, label)
+        result = self.recognizer.recognize_google(audio, show_all=True)
+        alternatives = [alt["transcript"].lower() for alt in result.get("alternative", [])
+                        if "transcript" in alt] if isinstance(result, dict) else []
+        if not alternatives:
+            raise sr.UnknownValueError()
+        # A trigger phrase in any hypothesis counts, not only in the best one
+        for text in alternatives:
+            if self.matcher.first(text) is not None:
+                return text
+        return alternatives[0]
+
+    def _recognize_pcm(self, pcm):
+        """Recognize a window of raw capture audio; returns text or None"""
+        if self.vad is not None and not self.vad.is_speech(pcm):
+            _SKIPPED_PHRASES.inc()
+            return None
+        audio = sr.AudioData(pcm, self.microphone.SAMPLE_RATE, self.microphone.SAMPLE_WIDTH)
+        try:
+            return self._recognize(audio)
+        except sr.UnknownValueError:
+            return None
+
+    def _match_command(self, text):
+        """Return the action of the first trigger phrase completed in the text"""
+        match = self.matcher.first(text)
+        if match is None:
+            return None
+        _COMMANDS[match.action.split(":", 1)[0]].inc()
+        return match.action
+
+    def _act(self, command):
+        """Announce a detected action and send any alert it calls for.
+
+        Returns "start" or "stop" for the caller; contact alerts are
+        handled here and return None.
+        """
+        mode_info = " (Simulation)" if self.simulation_mode else ""
+        if command == "start":
+            print(f"Start command detected!{mode_info}")
+            self._send_recording_alert()
+        elif command == "stop":
+            print(f"Stop command detected!{mode_info}")
+        elif command is not None and command.startswith("alert:"):
+            contact = command.split(":", 1)[1]
+            print(f"Alert phrase detected! Alerting {contact}")
+            self._send_recording_alert(contact, reason="emergency alert")
+            return None
+        return command
+
     def listen_for_command(self):
         """Listen for commands and return the detected command"""
         if self.simulation_mode:
+            if self.commands is not None:
+                user_input = self.commands()
+                if user_input is None:
+                    return None
+                user_input = user_input.strip().lower()
+                print(f"\nScripted input: '{user_input}'")
             # Check if running in an interactive environment
-            if sys.stdin.isatty():
+            elif sys.stdin.isatty():
                 print(f"\nSimulation Mode: Enter command manually ('{self.start_command}' or '{self.stop_command}'):")
                 try:
                     user_input = input().strip().lower()
@@ -57,35 +260,35 @@ class VoiceDetector:
                 user_input = self.start_command
                 print(f"\nUsing default start command: '{user_input}'")
 
-            if user_input == self.start_command:
-                print("Start command detected! (Simulation)")
-                self._send_recording_alert()
-                return "start"
-            elif user_input == self.stop_command:
-                print("Stop command detected! (Simulation)")
-                return "stop"
-            return None
+            return self._act(self._match_command(user_input))
+
+        if self.continuous is not None:
+            # Commands arrive from the background windows; wait briefly so
+            # the caller's loop stays responsive
+            return self._act(self.continuous.get(timeout=3))
 
         try:
             with self.microphone as source:
                 print(f"\nListening for commands ('{self.start_command}' to start, '{self.stop_command}' to end)...")
+                if self.vad is not None:
+                    # Start phrases relative to the tracked noise floor
+                    self.recognizer.energy_threshold = self.vad.energy_threshold
                 # Shorter timeout and phrase time limit for more responsive detection
-                audio = self.recognizer.listen(source, timeout=3, phrase_time_limit=2)
+                with _LISTEN_LATENCY.time():
+                    audio = self.recognizer.listen(source, timeout=3, phrase_time_limit=2)
+
+                # Skip recognition of phrases that are only noise
+                if self.vad is not None and not self.vad.is_speech(audio.get_raw_data()):
+                    _SKIPPED_PHRASES.inc()
+                    return None
 
                 try:
-                    # Use Google Speech Recognition
-                    text = self.recognizer.recognize_google(audio).lower()
+                    # Use Google Speech Recognition or the offline keyword spotter
+                    text = self._recognize(audio)
                     print(f"Detected: {text}")
 
-                    # Check for specific commands
-                    if self.start_command in text:
-                        print("Start command detected!")
-                        self._send_recording_alert()
-                        return "start"
-                    elif self.stop_command in text:
-                        print("Stop command detected!")
-                        return "stop"
-                    return None
+                    # Check for trigger phrases
+                    return self._act(self._match_command(text))
 
                 except sr.UnknownValueError:
                     print("Could not understand audio")
@@ -0,0 +1,199 @@
+import json
+import mmap
+import os
+import struct
+import wave
+import numpy as np
+
+# Frames copied per block when exporting, so memory use stays constant
+EXPORT_BLOCK_FRAMES = 1 << 18
+
+
+class WavReader:
+    """Random access to the audio of a 16-bit PCM WAV file.
+
+    The file is memory-mapped and samples are returned as NumPy views
+    into the mapping, so reading a minute from a multi-gigabyte recording
+    only touches the pages of that minute. A file still being written (or
+    cut short by a crash) is read up to the end of its complete frames,
+    even if its header has not been patched yet.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._parse_header()
+            length = self.data_offset + self.frames * self.frame_size
+            self._map = mmap.mmap(self._file.fileno(), length, access=mmap.ACCESS_READ) if self.frames else None
+        except Exception:
+            self._file.close()
+            raise
+        self.samples = (np.frombuffer(self._map, dtype='<i2', count=self.frames * self.channels,
+                                      offset=self.data_offset).reshape(-1, self.channels)
+                        if self._map is not None else np.zeros((0, self.channels), dtype='<i2'))
+
+    def _parse_header(self):
+        riff, riff_size, wave_id = struct.unpack('<4sI4s', self._file.read(12))
+        if riff != b'RIFF' or wave_id != b'WAVE':
+            raise ValueError(f"{self.path} is not a WAV file")
+        file_size = os.fstat(self._file.fileno()).st_size
+        fmt = None
+        while True:
+            header = self._file.read(8)
+            if len(header) < 8:
+                raise ValueError(f"{self.path} has no data chunk")
+            chunk_id, size = struct.unpack('<4sI', header)
+            if chunk_id == b'fmt ':
+                fmt = struct.unpack('<HHIIHH', self._file.read(16))
+                self._file.seek(size - 16 + size % 2, os.SEEK_CUR)
+            elif chunk_id == b'data':
+                break
+            else:
+                self._file.seek(size + size % 2, os.SEEK_CUR)
+        if fmt is None:
+            raise ValueError(f"{self.path} has no format chunk")
+        audio_format, self.channels, self.sample_rate, _, _, bits = fmt
+        if audio_format != 1 or bits != 16:
+            raise ValueError(f"{self.path} is not 16-bit PCM")
+        self.frame_size = 2 * self.channels
+        self.data_offset = self._file.tell()
+        available = file_size - self.data_offset
+        data_size = min(size, available)
+        if riff_size + 8 <= self.data_offset + size + size % 2:
+            # Nothing follows the data chunk, so bytes past its recorded
+            # size were appended after the header was last patched
+            data_size = available
+        self.frames = data_size // self.frame_size
+
+    @property
+    def duration(self):
+        return self.frames / self.sample_rate
+
+    def _frame_range(self, start, end):
+        """Clamp a time range in seconds to frame indices"""
+        end = self.duration if end is None else end
+        first = min(max(0, int(round(start * self.sample_rate))), self.frames)
+        last = min(max(first, int(round(end * self.sample_rate))), self.frames)
+        return first, last
+
+    def views(self, start=0.0, end=None):
+        """Return the range as a list of (frames, channels) views"""
+        first, last = self._frame_range(start, end)
+        return [self.samples[first:last]]
+
+    def read(self, start=0.0, end=None):
+        """Return samples from start to end seconds as a view into the file"""
+        return self.views(start, end)[0]
+
+    def export(self, start, end, path):
+        """Write the range to a new WAV file; returns the frames written"""
+        return export_views(self.views(start, end), path, self.sample_rate, self.channels)
+
+    def close(self):
+        """Release the mapping; views handed out must no longer be used"""
+        self.samples = None
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # A caller still holds a view; the mapping goes with it
+                pass
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class SegmentedReader:
+    """Random access across the segments of a SegmentedWavWriter session.
+
+    Only the segments overlapping a requested range are opened. Ranges
+    that span segments come back as one view per segment from views();
+    read() joins them, copying only the requested audio.
+    """
+
+    def __init__(self, manifest_path):
+        if os.path.isdir(manifest_path):
+            manifest_path = os.path.join(manifest_path, "manifest.json")
+        self.path = manifest_path
+        self.directory = os.path.dirname(manifest_path)
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        self.sample_rate = manifest["sample_rate"]
+        self.channels = manifest["channels"]
+        self.segments = manifest["segments"]
+        self.frames = sum(segment["frames"] for segment in self.segments)
+        self._readers = {}
+
+    @property
+    def duration(self):
+        return self.frames / self.sample_rate
+
+    def _reader(self, segment):
+        reader = self._readers.get(segment["index"])
+        if reader is None:
+            reader = self._readers[segment["index"]] = WavReader(os.path.join(self.directory, segment["file"]))
+        return reader
+
+    def views(self, start=0.0, end=None):
+        end = self.duration if end is None else end
+        first = max(0, int(round(start * self.sample_rate)))
+        last = min(self.frames, int(round(end * self.sample_rate)))
+        views = []
+        for segment in self.segments:
+            seg_first = segment["start_frame"]
+            seg_last = seg_first + segment["frames"]
+            if seg_last <= first or seg_first >= last:
+                continue
+            samples = self._reader(segment).samples
+            views.append(samples[max(first, seg_first) - seg_first:min(last, seg_last) - seg_first])
+        return views
+
+    def read(self, start=0.0, end=None):
+        views = self.views(start, end)
+        if len(views) == 1:
+            return views[0]
+        if not views:
+            return np.zeros((0, self.channels), dtype='<i2')
+        return np.concatenate(views)
+
+    def export(self, start, end, path):
+        return export_views(self.views(start, end), path, self.sample_rate, self.channels)
+
+    def close(self):
+        for reader in self._readers.values():
+            reader.close()
+        self._readers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def open_recording(path):
+    """Open a WAV recording, or a segmented session by manifest or directory"""
+    if os.path.isdir(path) or os.path.basename(path) == "manifest.json":
+        return SegmentedReader(path)
+    return WavReader(path)
+
+
+def export_views(views, path, sample_rate, channels):
+    """Stream sample views into a new WAV file in fixed-size blocks"""
+    frames = 0
+    with wave.open(path, 'wb') as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(2)
+        wf.setframerate(sample_rate)
+        for view in views:
+            for offset in range(0, len(view), EXPORT_BLOCK_FRAMES):
+                block = view[offset:offset + EXPORT_BLOCK_FRAMES]
+                wf.writeframesraw(block.tobytes())
+                frames += len(block)
+    return frames
@@ -0,0 +1,308 @@
+import json
+import os
+import queue
+import struct
+import threading
+import time
+
+# Size of the canonical 44-byte PCM WAV header written by _write_header
+HEADER_SIZE = 44
+
+# Largest data chunk the 32-bit RIFF sizes can describe (4 GiB less the
+# rest of the header, kept even)
+MAX_DATA_BYTES = (0xFFFFFFFF - 36) // 2 * 2
+
+
+class StreamingWavWriter:
+    """Append PCM audio to a WAV file as it arrives.
+
+    The RIFF and data chunk sizes are patched every `patch_interval` seconds
+    (and on close), so the file on disk is always a valid WAV holding
+    everything written up to the last patch. A WAV file cannot hold more
+    than MAX_DATA_BYTES of audio; anything written past that is dropped
+    with a warning (SegmentedWavWriter has no such limit).
+    """
+
+    def __init__(self, filename, channels, sample_width, sample_rate, patch_interval=1.0):
+        self.filename = filename
+        self.channels = channels
+        self.sample_width = sample_width
+        self.sample_rate = sample_rate
+        self.patch_interval = patch_interval
+        self.bytes_written = 0
+        self.max_bytes = MAX_DATA_BYTES // self.frame_size * self.frame_size
+        self.full = False
+        self._patched_bytes = 0
+        self._last_patch = time.monotonic()
+        self._file = open(filename, 'wb')
+        self._write_header()
+
+    @property
+    def frame_size(self):
+        return self.channels * self.sample_width
+
+    @property
+    def frames_written(self):
+        return self.bytes_written // self.frame_size
+
+    @property
+    def duration(self):
+        """Duration in seconds of the audio written so far"""
+        return self.frames_written / self.sample_rate
+
+    def _write_header(self):
+        """Write a PCM header describing `bytes_written` bytes of data"""
+        byte_rate = self.sample_rate * self.frame_size
+        self._file.write(struct.pack(
+            '<4sI4s4sIHHIIHH4sI',
+            b'RIFF', 36 + self.bytes_written + self.bytes_written % 2, b'WAVE',
+            b'fmt ', 16, 1, self.channels, self.sample_rate,
+            byte_rate, self.frame_size, self.sample_width * 8,
+            b'data', self.bytes_written
+        ))
+
+    @property
+    def room(self):
+        """Bytes that can still be written before the file is full"""
+        return self.max_bytes - self.bytes_written
+
+    def write(self, data):
+        """Append raw PCM bytes to the file"""
+        if len(data) > self.room:
+            data = memoryview(data).cast('B')[:self.room]
+            if not self.full:
+                self.full = True
+                print(f"\nWarning: {self.filename} has reached the WAV size limit; "
+                      "later audio is not saved (use segmented recording for longer sessions).")
+        self._file.write(data)
+        self.bytes_written += len(data)
+        if time.monotonic() - self._last_patch >= self.patch_interval:
+            self.patch_header()
+
+    def patch_header(self):
+        """Rewrite the header sizes so the file is valid up to this point"""
+        if self._patched_bytes != self.bytes_written:
+            self._file.seek(0)
+            try:
+                self._write_header()
+            finally:
+                # Later chunks must never land on top of the header
+                self._file.seek(0, os.SEEK_END)
+            self._patched_bytes = self.bytes_written
+        self._file.flush()
+        self._last_patch = time.monotonic()
+
+    def close(self):
+        """Patch the final sizes and close the file"""
+        if self._file.closed:
+            return
+        # A RIFF chunk must have an even length
+        if self.bytes_written % 2:
+            self._file.write(b'\x00')
+        self.patch_header()
+        self._file.close()
+
+    def discard(self):
+        """Close and delete the file"""
+        self.close()
+        try:
+            os.remove(self.filename)
+        except OSError:
+            pass
+
+
+class SegmentedWavWriter:
+    """Split a recording session into WAV segments of bounded size.
+
+    A segment is closed once it holds segment_seconds of audio (or
+    segment_bytes of data) and the next one continues at the exact next
+    frame, so no samples are lost at the boundaries. The session directory
+    holds segment_0001.wav, segment_0002.wav, ... and a manifest.json
+    listing each finished segment with its offset and duration. The
+    manifest is replaced atomically whenever a segment closes, and
+    on_segment(path, info) is called so finished segments can be processed
+    while recording continues.
+    """
+
+    def __init__(self, directory, channels, sample_width, sample_rate, segment_seconds=None,
+                 segment_bytes=None, patch_interval=1.0, on_segment=None):
+        if not segment_seconds and not segment_bytes:
+            raise ValueError("segment_seconds or segment_bytes is required")
+        self.directory = directory
+        self.channels = channels
+        self.sample_width = sample_width
+        self.sample_rate = sample_rate
+        self.patch_interval = patch_interval
+        self.on_segment = on_segment
+        self.segments = []
+        self.bytes_written = 0
+        self.started_at = time.time()
+
+        limits = []
+        if segment_seconds:
+            limits.append(int(segment_seconds * sample_rate) * self.frame_size)
+        if segment_bytes:
+            limits.append(segment_bytes // self.frame_size * self.frame_size)
+        limits.append(MAX_DATA_BYTES // self.frame_size * self.frame_size)
+        self.segment_limit = max(self.frame_size, min(limits))
+
+        os.makedirs(directory, exist_ok=True)
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        self._current = None
+        self._closed = False
+        self._write_manifest()
+
+    @property
+    def filename(self):
+        return self.manifest_path
+
+    @property
+    def frame_size(self):
+        return self.channels * self.sample_width
+
+    @property
+    def frames_written(self):
+        return self.bytes_written // self.frame_size
+
+    @property
+    def duration(self):
+        return self.frames_written / self.sample_rate
+
+    def write(self, data):
+        """Append raw PCM bytes, rolling over to new segments as needed"""
+        view = memoryview(data).cast('B')
+        while len(view):
+            if self._current is None:
+                self._open_segment()
+            room = self.segment_limit - self._current.bytes_written
+            part = view[:room]
+            self._current.write(part)
+            self.bytes_written += len(part)
+            view = view[len(part):]
+            if self._current.bytes_written >= self.segment_limit:
+                self._close_segment()
+
+    def _open_segment(self):
+        path = os.path.join(self.directory, f"segment_{len(self.segments) + 1:04d}.wav")
+        self._current = StreamingWavWriter(
+            path, self.channels, self.sample_width, self.sample_rate, self.patch_interval
+        )
+        self._current_start = self.frames_written
+
+    def _close_segment(self):
+        segment, self._current = self._current, None
+        segment.close()
+        info = {
+            "index": len(self.segments) + 1,
+            "file": os.path.basename(segment.filename),
+            "start_frame": self._current_start,
+            "frames": segment.frames_written,
+            "offset_seconds": self._current_start / self.sample_rate,
+            "duration_seconds": segment.duration,
+            "bytes": os.path.getsize(segment.filename),
+            "closed_at": time.time()
+        }
+        self.segments.append(info)
+        self._write_manifest()
+        if self.on_segment:
+            try:
+                self.on_segment(segment.filename, info)
+            except Exception as e:
+                print(f"\nWarning: Segment callback failed: {str(e)}")
+
+    def _write_manifest(self):
+        """Atomically replace the manifest with the current state"""
+        manifest = {
+            "sample_rate": self.sample_rate,
+            "channels": self.channels,
+            "sample_width": self.sample_width,
+            "segment_limit_bytes": self.segment_limit,
+            "started_at": self.started_at,
+            "complete": self._closed,
+            "total_frames": sum(segment["frames"] for segment in self.segments),
+            "duration_seconds": sum(segment["duration_seconds"] for segment in self.segments),
+            "segments": self.segments
+        }
+        temp_path = self.manifest_path + ".tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(temp_path, self.manifest_path)
+
+    def close(self):
+        """Close the last segment and mark the manifest complete"""
+        if self._closed:
+            return
+        if self._current is not None:
+            if self._current.bytes_written:
+                self._close_segment()
+            else:
+                self._current.discard()
+                self._current = None
+        self._closed = True
+        self._write_manifest()
+
+    def discard(self):
+        """Close and delete every segment, the manifest and the directory"""
+        self.close()
+        for segment in self.segments:
+            try:
+                os.remove(os.path.join(self.directory, segment["file"]))
+            except OSError:
+                pass
+        try:
+            os.remove(self.manifest_path)
+            os.rmdir(self.directory)
+        except OSError:
+            pass
+
+
+class BackgroundWavWriter:
+    """Run a StreamingWavWriter on its own thread.
+
+    The capture thread hands chunks over with write(), which only enqueues
+    them, so slow disks never stall reading from the audio device.
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def filename(self):
+        return self.writer.filename
+
+    def write(self, data):
+        """Queue a chunk for writing"""
+        self._queue.put(data)
+
+    def _run(self):
+        """Drain the queue into the writer until close() sends None"""
+        while True:
+            data = self._queue.get()
+            if data is None:
+                break
+            try:
+                self.writer.write(data)
+            except Exception as e:
+                print(f"\nError writing recording: {str(e)}")
+        self.writer.close()
+
+    def close(self, timeout=5.0):
+        """Flush pending chunks, finalize the file and stop the thread.
+
+        Waits for the whole queue to be written, so the file is complete
+        on return; timeout only controls when a slow disk is reported.
+        """
+        self._queue.put(None)
+        self._thread.join(timeout=timeout)
+        if self._thread.is_alive():
+            print(f"\nStill writing {self.filename}, waiting for the disk to catch up...")
+            self._thread.join()
+        return self.writer.bytes_written
+
+    def discard(self):
+        """Stop the thread and delete everything written"""
+        self.close()
+        self.writer.discard()